@@ -64,6 +64,12 @@ See: https://docs.python.org/3/using/configure.html#cmdoption-prefix"""
 DEFAULT_INSTALL_PREFIX = '/usr/local'
 
 TEMP_PREFIX = 'setup_python_'
+CHUNK_SIZE = 512 * 1024  # Download and hash files in 512 KiB chunks
+
+"""DocWrite: install_python.md ## Build cache
+If gcc reports a mismatch between the source code and reused PGO profile data, it's only a warning:"""
+PGO_REUSE_CFLAGS = '-Wno-error=coverage-mismatch -Wno-missing-profile'
+BUILD_STAMP_NAME = '.install_python-build-stamp'
 
 logger = logging.getLogger(__name__)
 
@@ -86,11 +92,15 @@ class TemporaryDirectory:
             return False
 
 
-def fetch(url: str) -> bytes:
+def urlopen(url: str):
     """DocWrite: install_python.md # Install Python Interpreter
     Download only over verified HTTPS connection."""
     context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-    with urllib.request.urlopen(url=url, context=context) as response:
+    return urllib.request.urlopen(url=url, context=context)
+
+
+def fetch(url: str) -> bytes:
+    with urlopen(url) as response:
         return response.read()
 
 
@@ -121,11 +131,11 @@ def run(args, **kwargs):
     return subprocess.run(args, **kwargs)
 
 
-def run_build_step(args, *, step: str, cwd: Path) -> None:
+def run_build_step(args, *, step: str, cwd: Path, env: dict | None = None) -> None:
     with tempfile.NamedTemporaryFile(prefix=f'{TEMP_PREFIX}_{step}_', suffix='.txt', delete=False) as temp_file:
         logger.info('Running: %s... Output in %s', shlex.join(str(arg) for arg in args), temp_file.name)
         try:
-            subprocess.run(args, stdout=temp_file, stderr=temp_file, check=True, cwd=cwd)
+            subprocess.run(args, stdout=temp_file, stderr=temp_file, check=True, cwd=cwd, env=env)
         except subprocess.SubprocessError as err:
             logger.error('Failed to run %s step: %s', step, err)
             run(['tail', temp_file.name])
@@ -144,7 +154,9 @@ def download2temp(*, temp_path: Path, base_url: str, filename: str) -> Path:
     url = f'{base_url}/{filename}'
     dst_path = temp_path / filename
     logger.info('Downloading %s into %s...', url, dst_path)
-    dst_path.write_bytes(fetch(url))
+    with urlopen(url) as response, dst_path.open('wb') as f:
+        # Write in chunks, to keep the memory usage constant:
+        shutil.copyfileobj(response, f, length=CHUNK_SIZE)
     logger.info('Downloaded %s is %d Bytes', filename, dst_path.stat().st_size)
     return dst_path
 
@@ -154,7 +166,10 @@ def verify_download(*, major_version: str, tar_file_path: Path, asc_file_path: P
     The sha256 hash downloaded tar archive will logged.
     If `gpg` is available, the signature will be verified.
     """
-    hash_obj = hashlib.sha256(tar_file_path.read_bytes())
+    hash_obj = hashlib.sha256()
+    with tar_file_path.open('rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hash_obj.update(chunk)
     logger.info('Downloaded sha256: %s', hash_obj.hexdigest())
 
     """DocWrite: install_python.md # Install Python Interpreter
@@ -174,11 +189,132 @@ def verify_download(*, major_version: str, tar_file_path: Path, asc_file_path: P
         logger.warning('No GPG verification possible! (gpg not found)')
 
 
+def get_build_env(*, cache_path: Path | None) -> dict:
+    """DocWrite: install_python.md ## Build cache
+    If `ccache` is installed, all compiler calls will be done via `ccache`
+    and the compiled objects are stored in `<cache-dir>/ccache/`.
+    So unchanged source files will not be compiled again, e.g.: after a patch release.
+    """
+    env = dict(os.environ)
+    if cache_path and (ccache_bin := shutil.which('ccache')):
+        logger.info('Use %s in %s', ccache_bin, cache_path / 'ccache')
+        env['CC'] = f'{ccache_bin} {env.get("CC", "gcc")}'
+        env['CCACHE_DIR'] = str(cache_path / 'ccache')
+        env['CCACHE_MAXSIZE'] = env.get('CCACHE_MAXSIZE', '2G')
+        # Objects from "Python-3.X.Y" can be reused for "Python-3.X.Z":
+        env['CCACHE_BASEDIR'] = str(cache_path / 'src')
+        env['CCACHE_NOHASHDIR'] = '1'
+    return env
+
+
+def copy_pgo_profile(*, src_path: Path, dst_path: Path) -> int:
+    """
+    Copy all *.gcda profile files from src_path to dst_path, with the same relative paths.
+    """
+    count = 0
+    for gcda_path in src_path.rglob('*.gcda'):
+        dst_file_path = dst_path / gcda_path.relative_to(src_path)
+        dst_file_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(gcda_path, dst_file_path)
+        count += 1
+    logger.info('Copied %i PGO profile files from %s to %s', count, src_path, dst_path)
+    return count
+
+
+def remove_old_source_trees(*, src_path: Path, major_version: str, keep_name: str):
+    for path in src_path.glob(f'Python-{major_version}.*'):
+        if path.name != keep_name and path.is_dir():
+            logger.info('Remove old source tree %s', path)
+            shutil.rmtree(path)
+
+
+def build_python(
+    *,
+    major_version: str,
+    py_required_version: str,
+    temp_path: Path,
+    extracted_dir: Path,
+    cache_path: Path | None,
+    reuse_pgo_profile: bool,
+    delete_temp: bool,
+):
+    base_url = f'{PY_FTP_INDEX_URL}{py_required_version}'
+
+    tar_filename = f'Python-{py_required_version}.tar.xz'
+    asc_filename = f'{tar_filename}.asc'
+    asc_file_path = download2temp(
+        temp_path=temp_path,
+        base_url=base_url,
+        filename=asc_filename,
+    )
+    tar_file_path = download2temp(
+        temp_path=temp_path,
+        base_url=base_url,
+        filename=tar_filename,
+    )
+    verify_download(
+        major_version=major_version,
+        tar_file_path=tar_file_path,
+        asc_file_path=asc_file_path,
+        delete_temp=delete_temp,
+    )
+
+    if extracted_dir.exists():
+        logger.info('Remove incomplete build %s', extracted_dir)
+        shutil.rmtree(extracted_dir)
+
+    tar_bin = shutil.which('tar')
+    logger.debug('Extracting %s with ...', tar_file_path)
+    run([tar_bin, 'xf', tar_file_path], check=True, cwd=extracted_dir.parent)
+
+    logger.info('Building Python %s (may take a while)...', py_required_version)
+
+    env = get_build_env(cache_path=cache_path)
+
+    """DocWrite: install_python.md ## Workflow - 6. Build and install Python
+    If the verify passed, the script will start the build process."""
+    run_build_step(
+        ['./configure', '--enable-optimizations'],
+        step='configure',
+        cwd=extracted_dir,
+        env=env,
+    )
+
+    make_args = ['make', f'-j{os.cpu_count()}']
+
+    """DocWrite: install_python.md ## Build cache
+    With `--reuse-pgo-profile` the PGO profile data of the last build with the same major version
+    (stored in `<cache-dir>/pgo/X.Y/`) will be used and the expensive profile run is skipped.
+    The profile data is only stored, if the profile run was really done."""
+    profile_path = cache_path / 'pgo' / major_version if cache_path else None
+    profile_reused = False
+    if reuse_pgo_profile and profile_path and profile_path.is_dir():
+        if copy_pgo_profile(src_path=profile_path, dst_path=extracted_dir):
+            # The Makefile skips the profile run, if this stamp file exists:
+            (extracted_dir / 'profile-run-stamp').touch()
+            make_args.append(f'EXTRA_CFLAGS={PGO_REUSE_CFLAGS}')
+            profile_reused = True
+
+    run_build_step(
+        make_args,
+        step='make',
+        cwd=extracted_dir,
+        env=env,
+    )
+
+    if profile_path and not profile_reused:
+        if profile_path.exists():
+            shutil.rmtree(profile_path)
+        copy_pgo_profile(src_path=extracted_dir, dst_path=profile_path)
+
+
 def install_python(
     major_version: str,
     *,
     write_check: bool = True,
     delete_temp: bool = True,
+    cache_path: Path | None = None,
+    reuse_pgo_profile: bool = False,
 ) -> Path:
     logger.info('Requested major Python version: %s', major_version)
 
@@ -223,51 +359,37 @@ def install_python(
     if write_check and not os.access(local_bin_path, os.W_OK):
         raise PermissionError(f'No write permission to {local_bin_path} (Hint: Call with "sudo" ?!)')
 
+    """DocWrite: install_python.md ## Build cache
+    With `--cache-dir` the source tree of the latest build is kept in `<cache-dir>/src/Python-X.Y.Z/`.
+    If this version is already build there, only `make altinstall` will be done.
+    Source trees of older versions with the same major version will be removed."""
+    if cache_path:
+        build_root = cache_path / 'src'
+        build_root.mkdir(parents=True, exist_ok=True)
+    else:
+        build_root = None
+
     """DocWrite: install_python.md ## Workflow - 4. Download Python sources
     The download will be done in a temporary directory. The directory will be deleted after the installation.
     This can be skipped via CLI argument. The directory will be prefixed with:
     DocWriteMacro: manageprojects.tests.docwrite_macros_install_python.temp_prefix"""
     with TemporaryDirectory(prefix=TEMP_PREFIX, delete=delete_temp) as temp_path:
-        base_url = f'{PY_FTP_INDEX_URL}{py_required_version}'
-
-        tar_filename = f'Python-{py_required_version}.tar.xz'
-        asc_filename = f'{tar_filename}.asc'
-        asc_file_path = download2temp(
-            temp_path=temp_path,
-            base_url=base_url,
-            filename=asc_filename,
-        )
-        tar_file_path = download2temp(
-            temp_path=temp_path,
-            base_url=base_url,
-            filename=tar_filename,
-        )
-        verify_download(
-            major_version=major_version,
-            tar_file_path=tar_file_path,
-            asc_file_path=asc_file_path,
-            delete_temp=delete_temp,
-        )
-
-        tar_bin = shutil.which('tar')
-        logger.debug('Extracting %s with ...', tar_file_path)
-        run([tar_bin, 'xf', tar_file_path], check=True, cwd=temp_path)
-        extracted_dir = temp_path / f'Python-{py_required_version}'
-
-        logger.info('Building Python %s (may take a while)...', py_required_version)
-
-        """DocWrite: install_python.md ## Workflow - 6. Build and install Python
-        If the verify passed, the script will start the build process."""
-        run_build_step(
-            ['./configure', '--enable-optimizations'],
-            step='configure',
-            cwd=extracted_dir,
-        )
-        run_build_step(
-            ['make', f'-j{os.cpu_count()}'],
-            step='make',
-            cwd=extracted_dir,
-        )
+        extracted_dir = (build_root or temp_path) / f'Python-{py_required_version}'
+        build_stamp_path = extracted_dir / BUILD_STAMP_NAME
+
+        if build_stamp_path.is_file():
+            logger.info('Python %s already build in %s', py_required_version, extracted_dir)
+        else:
+            build_python(
+                major_version=major_version,
+                py_required_version=py_required_version,
+                temp_path=temp_path,
+                extracted_dir=extracted_dir,
+                cache_path=cache_path,
+                reuse_pgo_profile=reuse_pgo_profile,
+                delete_temp=delete_temp,
+            )
+            build_stamp_path.touch()
 
         """DocWrite: install_python.md ## Workflow - 6. Build and install Python
         The installation will be done with `make altinstall`."""
@@ -275,8 +397,12 @@ def install_python(
             ['make', 'altinstall'],
             step='install',
             cwd=extracted_dir,
+            env=get_build_env(cache_path=cache_path),
         )
 
+    if build_root:
+        remove_old_source_trees(src_path=build_root, major_version=major_version, keep_name=extracted_dir.name)
+
     logger.info('Python %s installed to %s', py_required_version, local_python_path)
 
     local_python_version = get_python_version(local_python_path)
@@ -324,6 +450,17 @@ def get_parser() -> argparse.ArgumentParser:
         action='store_true',
         help='Skip the test for write permission to /usr/local/bin',
     )
+    parser.add_argument(
+        '--cache-dir',
+        type=Path,
+        default=None,
+        help='Keep the source tree, ccache objects and PGO profile data in this directory',
+    )
+    parser.add_argument(
+        '--reuse-pgo-profile',
+        action='store_true',
+        help='Reuse the PGO profile data of the last build from the cache directory (skips the profile run)',
+    )
     return parser
 
 
@@ -341,6 +478,8 @@ def main() -> Path:
         major_version=args.major_version,
         write_check=not args.skip_write_check,
         delete_temp=not args.skip_temp_deletion,
+        cache_path=args.cache_dir,
+        reuse_pgo_profile=args.reuse_pgo_profile,
     )
 
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+Create a lock file with hashes for the given requirements, resolved from a local wheelhouse, e.g.:
+
+    .venv/bin/python3 lock_requirements.py --wheelhouse /var/cache/umap_ynh/wheels/umap/cpython-311-x86_64-linux-gnu \
+        --output requirements.lock -- -r requirements.txt
+
+The wheels must be build before, e.g. with "pip wheel --wheel-dir <wheelhouse> -r requirements.txt".
+The lock file can be installed with "pip install --no-index --find-links <wheelhouse> --require-hashes -r <lock>".
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+
+CHUNK_SIZE = 512 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(file_path: Path) -> str:
+    file_hash = hashlib.sha256()
+    with file_path.open('rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def resolve(*, wheelhouse: Path, requirements: list[str]) -> list[dict]:
+    """
+    Resolve the requirements only from the wheelhouse via "pip install --dry-run --report"
+    """
+    with tempfile.TemporaryDirectory(prefix='lock_requirements_') as temp_dir:
+        report_path = Path(temp_dir) / 'report.json'
+        args = [
+            sys.executable,
+            '-m',
+            'pip',
+            'install',
+            '--dry-run',
+            '--ignore-installed',
+            '--quiet',
+            '--no-index',
+            '--find-links',
+            str(wheelhouse),
+            '--report',
+            str(report_path),
+            *requirements,
+        ]
+        logger.debug('Running: %s', args)
+        subprocess.run(args, check=True)
+        report = json.loads(report_path.read_text())
+    return report['install']
+
+
+def get_lock_lines(*, wheelhouse: Path, requirements: list[str]) -> list[str]:
+    lines = []
+    for item in resolve(wheelhouse=wheelhouse, requirements=requirements):
+        metadata = item['metadata']
+        url = urlparse(item['download_info']['url'])
+        assert url.scheme == 'file', f'Not a local file: {item["download_info"]["url"]}'
+        wheel_path = Path(unquote(url.path))
+        assert wheel_path.parent == wheelhouse, f'{wheel_path} is not in {wheelhouse}'
+        lines.append(f'{metadata["name"]}=={metadata["version"]} --hash=sha256:{hash_file(wheel_path)}')
+    return sorted(lines, key=str.lower)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Lock requirements with hashes from a local wheelhouse')
+    parser.add_argument('--wheelhouse', type=Path, required=True)
+    parser.add_argument('--output', type=Path, required=True)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('requirements', nargs='+', help='Arguments for "pip install", e.g.: -r requirements.txt')
+    args = parser.parse_args(args=args)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(levelname)9s %(message)s',
+        stream=sys.stderr,
+    )
+
+    wheelhouse = args.wheelhouse.resolve()
+    lines = get_lock_lines(wheelhouse=wheelhouse, requirements=args.requirements)
+
+    temp_path = args.output.with_name(f'{args.output.name}.tmp')
+    temp_path.write_text(
+        f'# Created by {Path(__file__).name} from {" ".join(args.requirements)}\n'
+        f'# Install with: pip install --no-index --find-links {wheelhouse} --require-hashes -r {args.output.name}\n'
+        + ''.join(f'{line}\n' for line in lines)
+    )
+    os.replace(temp_path, args.output)
+    logger.info('%i requirements locked in %s', len(lines), args.output)
+
+
+if __name__ == '__main__':
+    main()
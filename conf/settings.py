@@ -11,12 +11,14 @@
 ################################################################################
 ################################################################################
 
+import os as __os
 from pathlib import Path as __Path
 
 from django_yunohost_integration.base_settings import *  # noqa:F401,F403
 from django_yunohost_integration.secret_key import (
     get_or_create_secret as __get_or_create_secret,
 )
+from psycopg_pool import ConnectionPool as __ConnectionPool
 
 # https://github.com/jedie/django-example
 from umap.settings.base import *  # noqa:F401,F403 isort:skip
@@ -44,6 +46,7 @@ YNH_CURRENT_HOST = (
 DEBUG = False
 
 LOG_LEVEL = "WARNING"
+LOG_FORMAT = "__LOG_FORMAT__"  # "text" or "json" (one JSON object per line)
 ADMIN_EMAIL = "__EMAIL__"
 DEFAULT_FROM_EMAIL = "__EMAIL__"
 FORCE_SCRIPT_NAME = f"/{PATH_URL}"
@@ -59,6 +62,7 @@ YNH_BASIC_AUTH_HEADER_KEY = "HTTP_AUTHORIZATION"
 
 INSTALLED_APPS = list(INSTALLED_APPS)
 INSTALLED_APPS.append("django_yunohost_integration.apps.YunohostIntegrationConfig")
+INSTALLED_APPS.append("umap_ynh.apps.UmapYnhConfig")
 
 
 SECRET_KEY = __get_or_create_secret(
@@ -66,12 +70,21 @@ SECRET_KEY = __get_or_create_secret(
 )  # /home/yunohost.app/$app/secret.txt
 
 
+# Additional URLs of this package in front of the uMap URLs:
+ROOT_URLCONF = "umap_ynh.urls"
+
+
 MIDDLEWARE = list(MIDDLEWARE)
+# Add the app path to "X-Accel-Redirect" responses:
+MIDDLEWARE.insert(0, "umap_ynh.middleware.XAccelRedirectPrefixMiddleware")
 MIDDLEWARE.insert(
     MIDDLEWARE.index("django.contrib.auth.middleware.AuthenticationMiddleware") + 1,
-    # login a user via HTTP_REMOTE_USER header from SSOwat:
-    "django_yunohost_integration.sso_auth.auth_middleware.SSOwatRemoteUserMiddleware",
+    # login a user via HTTP_REMOTE_USER header from SSOwat
+    # (SSOwatRemoteUserMiddleware, that caches the user lookup):
+    "umap_ynh.sso.CachedSSOwatRemoteUserMiddleware",
 )
+# Seconds to cache the user looked up by the SSO middleware, capped at the expiry of the SSOwat JWT:
+YNH_SSO_CACHE_TIMEOUT = 60
 
 
 # Keep ModelBackend around for per-user permissions and superuser
@@ -101,6 +114,14 @@ ADMINS = (("__ADMIN__", ADMIN_EMAIL),)
 
 MANAGERS = ADMINS
 
+# Number of uvicorn worker processes, see "workers" app setting:
+YNH_WORKERS = int("__WORKERS__")
+
+# Maximum number of PostgreSQL connections of all workers together.
+# Each worker has its own connection pool with a part of them, so workers * max_size <= YNH_DB_MAX_CONNECTIONS.
+# install, upgrade and the config panel limit the workers to YNH_DB_MAX_CONNECTIONS / 2, see: myynh_clamp_workers()
+YNH_DB_MAX_CONNECTIONS = int("__DB_MAX_CONNECTIONS__")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.contrib.gis.db.backends.postgis",
@@ -109,16 +130,46 @@ DATABASES = {
         "PASSWORD": "__DB_PWD__",
         "HOST": "127.0.0.1",
         "PORT": "5432",  # Default Postgres Port
-        "CONN_MAX_AGE": 600,
+        "CONN_MAX_AGE": 0,  # Persistent connections are replaced by the pool
+        "OPTIONS": {
+            # https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+            "pool": {
+                "min_size": 1,
+                "max_size": max(1, YNH_DB_MAX_CONNECTIONS // YNH_WORKERS),
+                "timeout": 10,  # Wait max. 10 sec. for a free connection
+                "max_idle": 5 * 60,  # Close unused connections after 5 min.
+                "max_lifetime": 60 * 60,  # Reconnect every hour
+                "check": __ConnectionPool.check_connection,  # Check connections before use
+            },
+        },
     }
 }
 REDIS_URL = "redis://127.0.0.1:6379/__REDIS_DB__"
 
+# _____________________________________________________________________________
+# Cache and sessions
+
+# Use the Redis DB of this app instance as cache, shared by all uvicorn workers.
+# Every key gets a timeout, so a Redis "maxmemory-policy volatile-lru" can evict them.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "__APP__",
+        "TIMEOUT": 60 * 60,
+    }
+}
+
+# Sessions are read from the cache and written through to the database:
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
 # Title of site to use
 SITE_TITLE = "__APP__"
 
 # Site domain
 SITE_DOMAIN = "__DOMAIN__"
+# Absolute URLs and the host check of the ajax proxy:
+SITE_URL = f"https://{SITE_DOMAIN}"
 
 # Subject of emails includes site title
 EMAIL_SUBJECT_PREFIX = f"[{SITE_TITLE}] "
@@ -144,17 +195,48 @@ else:
     STATIC_URL = "/static/"
     MEDIA_URL = "/media/"
 
-STATIC_ROOT = str(INSTALL_DIR_PATH / "static")
+# Upgrades collect the static files of the new release into a separate directory:
+STATIC_ROOT = __os.environ.get("YNH_STATIC_ROOT", str(INSTALL_DIR_PATH / "static"))
 MEDIA_ROOT = str(INSTALL_DIR_PATH / "media")
+
+# Let nginx serve the datalayer files and the ajax proxy requests.
+# See "internal" and "proxy" locations in nginx.conf
+UMAP_XSENDFILE_HEADER = "X-Accel-Redirect"
+# Current versions of the datalayers of public maps, nginx answers conditional GETs with them.
+# See "datalayer" location in nginx.conf and umap_ynh/datalayer_index.py
+YNH_DATALAYER_INDEX_DIR = str(INSTALL_DIR_PATH / "datalayer_index")
+
+# Write pre-compressed copies of the datalayers on save and of the static files
+# on collectstatic (with hashed names, see uMap's ManifestStaticFilesStorage), for nginx "gzip_static":
+STORAGES = {
+    **STORAGES,
+    "data": {"BACKEND": "umap_ynh.storage.YunohostDataStorage"},
+    "staticfiles": {"BACKEND": "umap_ynh.storage.YunohostStaticFilesStorage"},
+}
+
+# Retention of the datalayer versions, applied on every save and daily by "umap prune_datalayer_versions".
+# Keep the "last" versions and the newest version of the last "daily" days and "weekly" weeks with versions.
+# See: umap_ynh/versions.py -- None: uMap keeps only the last UMAP_KEEP_VERSIONS versions.
+YNH_VERSIONS_RETENTION = {"last": 10, "daily": 7, "weekly": 4}
+
 UMAP_PICTOGRAMS_COLLECTIONS = {
     "OSMIC": {"path": DATA_DIR_PATH / "icons", "attribution": "Osmic"},
 }
+# Minify the pictograms of the collections and build their catalog on collectstatic, see: umap_ynh/pictograms.py
+STATICFILES_FINDERS += ["umap_ynh.pictograms.PictogramFinder"]
 
 # Do not allow to edit username, as it's managed by the Yunohost SSO
 UMAP_ALLOW_EDIT_PROFILE = False
+# The Overpass importer requests the caching proxy of this package, see: umap_ynh/overpass.py
+# Absolute: The URL is also used by remote data layers ("link" import), via the ajax proxy or directly.
 UMAP_IMPORTERS = {
-    "overpass": {"url": "https://overpass-api.de/api/interpreter"},
+    "overpass": {"url": f"{SITE_URL}{FORCE_SCRIPT_NAME.rstrip('/')}/overpass/interpreter"},
 }
+# Overpass server requested by nginx for the proxy, e.g. a local instance.
+# Timeout, cache size and TTL are set in nginx.conf and nginx_http.conf:
+YNH_OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+# Requests to the proxy (cached or not) per client IP and period in seconds:
+YNH_OVERPASS_RATE_LIMIT = (60, 10 * 60)
 # YunoHost will try to parse this file to get the values backs, so each variables
 # must be key = value, without anything else (not key = int(value)…)
 REALTIME = "__REALTIME__"
@@ -163,56 +245,79 @@ DEFAULT_LONGITUDE = "__DEFAULT_LONGITUDE__"
 DEFAULT_LATITUDE = "__DEFAULT_LATITUDE__"
 DEFAULT_ZOOM = "__DEFAULT_ZOOM__"
 OPENROUTESERVICE = "__OPENROUTESERVICE__"
+METRICS = "__METRICS__"
 REALTIME_ENABLED = REALTIME == "1"
 UMAP_ALLOW_ANONYMOUS = ALLOW_ANONYMOUS == "1"
 LEAFLET_LONGITUDE = float(DEFAULT_LONGITUDE)
 LEAFLET_LATITUDE = float(DEFAULT_LATITUDE)
 LEAFLET_ZOOM = int(DEFAULT_ZOOM)
 OPENROUTESERVICE_APIKEY = OPENROUTESERVICE
+YNH_METRICS_ENABLED = METRICS == "1"
+
+if YNH_METRICS_ENABLED:
+    # Record latency, DB queries and response size of all requests, see: umap_ynh/metrics.py
+    MIDDLEWARE.insert(0, "umap_ynh.metrics.MetricsMiddleware")
+    # The "/metrics" endpoint is only served to requests from the host itself, e.g.:
+    #   curl --unix-socket /run/<app>/uvicorn.sock http://localhost/<path>/metrics
+    #   curl http://127.0.0.1:<port>/<path>/metrics  (with "server_bind" app setting "tcp")
+    ALLOWED_HOSTS += ["127.0.0.1", "localhost"]
 
 # -----------------------------------------------------------------------------
 
+# Send only one error mail per logger, level and exception type within this seconds:
+YNH_ADMIN_MAIL_THROTTLE = 5 * 60
+
+# All loggers write into the "queue" handler, a background thread passes the records
+# to "log_file" and "mail_admins", see: umap_ynh/log.py
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "verbose": {
+        "text": {
             "format": "{asctime} {levelname} {name} {module}.{funcName} {message}",
             "style": "{",
         },
+        "json": {
+            "()": "umap_ynh.log.JsonFormatter",
+        },
     },
     "handlers": {
         "log_file": {
             "level": LOG_LEVEL,
             "class": "logging.handlers.WatchedFileHandler",
-            "formatter": "verbose",
+            "formatter": "json" if LOG_FORMAT == "json" else "text",
             "filename": str(LOG_FILE_PATH),
         },
         "mail_admins": {
             "level": "ERROR",
-            "formatter": "verbose",
-            "class": "django.utils.log.AdminEmailHandler",
+            "formatter": "text",
+            "class": "umap_ynh.log.ThrottledAdminEmailHandler",
             "include_html": True,
         },
+        # Handlers are configured sorted by name: "queue" must come after the ones it references.
+        "queue": {
+            "()": "umap_ynh.log.queue_handler",
+            "handlers": ["cfg://handlers.log_file", "cfg://handlers.mail_admins"],
+        },
     },
     "loggers": {
         "": {
-            "handlers": ["log_file", "mail_admins"],
+            "handlers": ["queue"],
             "level": LOG_LEVEL,
             "propagate": False,
         },
         "django": {
-            "handlers": ["log_file", "mail_admins"],
+            "handlers": ["queue"],
             "level": LOG_LEVEL,
             "propagate": False,
         },
         "django_yunohost_integration": {
-            "handlers": ["log_file", "mail_admins"],
+            "handlers": ["queue"],
             "level": LOG_LEVEL,
             "propagate": False,
         },
         "umap": {
-            "handlers": ["log_file", "mail_admins"],
+            "handlers": ["queue"],
             "level": LOG_LEVEL,
             "propagate": False,
         },
@@ -3,9 +3,17 @@
 """
 DocWrite: setup_python.md # Boot Redistributable Python
 
-This is a standalone script (one file and no dependencies) to download and setup
-https://github.com/indygreg/python-build-standalone/ redistributable Python.
+Download and setup https://github.com/indygreg/python-build-standalone/ redistributable Python.
 But only if it's needed!
+
+The script is still one file without dependencies outside the standard library, because it runs
+with the system Python, before any virtualenv exists. Besides the download, it contains:
+
+ * the parallel, resumable download in HTTP Range segments (`PartialDownload`)
+ * the verification and extraction while the archive is read (`extract_archive()`)
+ * the cache of verified archives and the offline mode (`ArchiveCache`)
+ * the cache of the release metadata with ETag and TTL (`MetadataCache`)
+ * the choice of the best build variant for the host CPU and platform (`Host`, `score_variant()`)
 """
 
 from __future__ import annotations
@@ -16,6 +24,7 @@ import datetime
 import hashlib
 import json
 import logging
+import os
 import platform
 import re
 import shlex
@@ -23,10 +32,14 @@ import shutil
 import ssl
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import time
+from concurrent import futures
+from http.client import HTTPException
 from pathlib import Path
-from urllib import request
+from urllib import error, request
 
 
 """DocWrite: setup_python.md # Boot Redistributable Python
@@ -36,13 +49,17 @@ assert sys.version_info >= (3, 9), f'Python version {sys.version_info} is too ol
 
 DEFAULT_MAJOR_VERSION = '3.12'
 GUTHUB_PROJECT = 'indygreg/python-build-standalone'
+GITHUB_API_URL = 'https://api.github.com'
 LASTEST_RELEASE_URL = f'https://raw.githubusercontent.com/{GUTHUB_PROJECT}/latest-release/latest-release.json'
 HASH_NAME = 'sha256'
 
 
 OPTIMIZATION_PRIORITY = ['pgo+lto', 'pgo', 'lto']
-TEMP_PREFIX = 'redist_python_'
 DOWNLOAD_CHUNK_SIZE = 512 * 1024  # 512 KiB
+DOWNLOAD_SEGMENTS = 4  # Number of parallel HTTP Range requests
+DOWNLOAD_RETRIES = 5  # Retries per segment, after network errors
+METADATA_TTL = 60 * 60  # Use cached release data without any request for 1h
+URL_TIMEOUT = 60  # Seconds to wait for the connection and every read
 
 logger = logging.getLogger(__name__)
 
@@ -65,81 +82,541 @@ def assert_is_file(path):
         raise FileNotFoundError(f'File does not exists: "{path}"')
 
 
-class TemporaryDirectory:
-    """tempfile.TemporaryDirectory in Python 3.9 has no "delete", yet."""
-
-    def __init__(self, prefix, delete: bool):
-        self.prefix = prefix
-        self.delete = delete
-
-    def __enter__(self) -> Path:
-        self.temp_path = Path(tempfile.mkdtemp(prefix=self.prefix))
-        return self.temp_path
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.delete:
-            shutil.rmtree(self.temp_path, ignore_errors=True)
-        if exc_type:
-            return False
-
-
-def urlopen(url: str):
+def urlopen(url: str, headers: dict | None = None):
     print(f'Fetching {url}', file=sys.stderr)
     """DocWrite: setup_python.md ## Workflow - 4. Download and verify Archive
     All downloads will be done with a secure connection (SSL) and server authentication."""
     context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-    return request.urlopen(url=url, context=context)
+    return request.urlopen(request.Request(url, headers=headers or {}), context=context, timeout=URL_TIMEOUT)
 
 
 def fetch(url: str) -> bytes:
     return urlopen(url).read()
 
 
-def fetch_json(url: str) -> dict:
-    return json.loads(fetch(url))
+@dataclasses.dataclass
+class Segment:
+    start: int
+    end: int  # inclusive
+    position: int
+
+    @property
+    def done(self) -> bool:
+        return self.position > self.end
+
+
+class PartialDownload:
+    """
+    A download into "<filename>.part" with a "<filename>.part.json" state file,
+    that stores the progress of all segments. So a interrupted download can be resumed.
+    """
+
+    def __init__(self, *, url: str, file_path: Path, total_size: int):
+        self.url = url
+        self.total_size = total_size
+        self.part_path = file_path.with_name(f'{file_path.name}.part')
+        self.state_path = file_path.with_name(f'{file_path.name}.part.json')
+        self.lock = threading.Lock()
+        self.segments = self.load_segments()
+
+    def load_segments(self) -> list[Segment]:
+        if self.part_path.is_file() and self.state_path.is_file():
+            try:
+                state = json.loads(self.state_path.read_text())
+            except ValueError:
+                logger.warning('Ignore invalid state file %s', self.state_path)
+            else:
+                if state.get('url') == self.url and state.get('total_size') == self.total_size:
+                    segments = [Segment(**segment) for segment in state['segments']]
+                    logger.info('Resume download from %s', self.part_path)
+                    return segments
+
+        logger.debug('Start new download into %s', self.part_path)
+        with self.part_path.open('wb') as f:
+            f.truncate(self.total_size)
+        return self.split(segment_count=DOWNLOAD_SEGMENTS)
+
+    def split(self, *, segment_count: int) -> list[Segment]:
+        segment_size = max(DOWNLOAD_CHUNK_SIZE, -(-self.total_size // segment_count))
+        segments = []
+        for start in range(0, self.total_size, segment_size):
+            end = min(start + segment_size, self.total_size) - 1
+            segments.append(Segment(start=start, end=end, position=start))
+        return segments
+
+    def save_state(self):
+        with self.lock:
+            state = dict(
+                url=self.url,
+                total_size=self.total_size,
+                segments=[dataclasses.asdict(segment) for segment in self.segments],
+            )
+        self.state_path.write_text(json.dumps(state))
+
+    @property
+    def downloaded(self) -> int:
+        with self.lock:
+            return sum(segment.position - segment.start for segment in self.segments)
+
+    def download_segment(self, segment: Segment, *, use_range: bool):
+        for retry in range(DOWNLOAD_RETRIES + 1):
+            if segment.done:
+                return
+            headers = {'Range': f'bytes={segment.position}-{segment.end}'} if use_range else {}
+            try:
+                with urlopen(self.url, headers=headers) as response, self.part_path.open('r+b') as f:
+                    if use_range and response.status != 206:
+                        raise OSError(f'Server ignores "Range" header (status: {response.status})')
+                    f.seek(segment.position)
+                    while not segment.done:
+                        chunk = response.read(min(DOWNLOAD_CHUNK_SIZE, segment.end - segment.position + 1))
+                        if not chunk:
+                            raise OSError(f'Connection closed at {segment.position} Bytes')
+                        f.write(chunk)
+                        with self.lock:
+                            segment.position += len(chunk)
+                return
+            except (OSError, HTTPException) as err:  # urllib.error.URLError is a subclass of OSError
+                if retry >= DOWNLOAD_RETRIES:
+                    raise
+                logger.warning('Download error at %s Bytes: %s (retry %i)', segment.position, err, retry + 1)
+                if not use_range:
+                    # Without "Range" support we can only restart from the beginning:
+                    with self.lock:
+                        segment.position = segment.start
+                time.sleep(retry + 1)
+
+    def run(self):
+        """DocWrite: setup_python.md ## Workflow - 4. Download and verify Archive
+        The archive will be downloaded in parallel segments via HTTP "Range" requests, if the server supports it.
+        After network errors, the download of a segment will be resumed."""
+        use_range = self.supports_range()
+        if not use_range:
+            logger.info('Server does not support "Range" requests: Download in one stream.')
+            self.segments = [Segment(start=0, end=self.total_size - 1, position=0)]
+
+        try:
+            with futures.ThreadPoolExecutor(max_workers=len(self.segments)) as executor:
+                pending = {
+                    executor.submit(self.download_segment, segment, use_range=use_range)
+                    for segment in self.segments
+                    if not segment.done
+                }
+                while pending:
+                    done, pending = futures.wait(pending, timeout=1, return_when=futures.FIRST_EXCEPTION)
+                    self.save_state()
+                    percent = (self.downloaded / self.total_size) * 100
+                    print(
+                        f'\rDownloaded {self.downloaded} Bytes ({percent:.1f}%)...',
+                        file=sys.stderr,
+                        end='',
+                        flush=True,
+                    )
+                    for future in done:
+                        future.result()  # Raise a download error
+        finally:
+            # Store the progress of all segments, to be able to resume the download:
+            self.save_state()
+
+    def supports_range(self) -> bool:
+        try:
+            response = urlopen(self.url, headers={'Range': 'bytes=0-0'})
+        except OSError as err:
+            logger.debug('Range request failed: %s', err)
+            return False
+        with response:
+            return response.status == 206
+
+    def finish(self, file_path: Path):
+        self.part_path.rename(file_path)
+        self.state_path.unlink()
+
+    def discard(self):
+        for path in (self.part_path, self.state_path):
+            if path.exists():
+                path.unlink()
+
+
+def hash_file(*, file_path: Path, hash_name: str) -> str:
+    file_hash = hashlib.new(hash_name)
+    with file_path.open('rb') as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
 
 
-def download(*, url: str, dst_path: Path, total_size: int, hash_name: str, hash_value: str) -> Path:
+def download(
+    *, url: str, dst_path: Path, total_size: int, hash_name: str, hash_value: str, filename: str | None = None
+) -> Path:
     """DocWrite: setup_python.md # Boot Redistributable Python
     The downloaded archive will be verified with the hash checksum.
     """
-    filename = Path(url).name
+    filename = filename or Path(url).name
     file_path = dst_path / filename
     logger.debug('Download %s into %s...', url, file_path)
 
-    file_hash = hashlib.new(hash_name)
-    response = urlopen(url)
-    next_update = time.monotonic() + 1
-    with file_path.open('wb') as f:
-        while True:
-            chunk = response.read(DOWNLOAD_CHUNK_SIZE)
-            if not chunk:
-                break
-            f.write(chunk)
-            file_hash.update(chunk)
-            if time.monotonic() >= next_update:
-                f.flush()
-                percent = (file_path.stat().st_size / total_size) * 100
-                print(
-                    f'\rDownloaded {file_path.stat().st_size} Bytes ({percent:.1f}%)...',
-                    file=sys.stderr,
-                    end='',
-                    flush=True,
-                )
-                next_update += 1
+    partial_download = PartialDownload(url=url, file_path=file_path, total_size=total_size)
+    partial_download.run()
 
-    file_size = file_path.stat().st_size
+    file_size = partial_download.part_path.stat().st_size
     print(f'\rDownloaded {file_size} Bytes (100%)', file=sys.stderr, flush=True)
     assert file_size == total_size, f'Downloaded {file_size=} Bytes is not expected {total_size=} Bytes!'
 
-    file_hash = file_hash.hexdigest()
+    file_hash = hash_file(file_path=partial_download.part_path, hash_name=hash_name)
     logger.debug('Check %s hash...', file_hash)
+    if file_hash != hash_value:
+        # Don't resume a broken download:
+        partial_download.discard()
     assert file_hash == hash_value, f'{file_hash=} != {hash_value=}'
     print(f'{hash_name} checksum verified: {file_hash!r}, ok.', file=sys.stderr)
 
+    partial_download.finish(file_path)
     return file_path
 
 
+def iter_file(file_path: Path):
+    with file_path.open('rb') as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+def iter_url(*, url: str, total_size: int):
+    """
+    Yield the content of the URL in chunks.
+    After network errors, the download will be resumed via HTTP "Range" request.
+    """
+    position = 0
+    for retry in range(DOWNLOAD_RETRIES + 1):
+        headers = {'Range': f'bytes={position}-'} if position else {}
+        try:
+            with urlopen(url, headers=headers) as response:
+                if position and response.status != 206:
+                    # The already yielded data can't be taken back:
+                    raise RuntimeError(f'Can not resume download: Server ignores "Range" header ({response.status=})')
+                while position < total_size:
+                    chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        raise OSError(f'Connection closed at {position} Bytes')
+                    position += len(chunk)
+                    percent = (position / total_size) * 100
+                    print(f'\rDownloaded {position} Bytes ({percent:.1f}%)...', file=sys.stderr, end='', flush=True)
+                    yield chunk
+            print(file=sys.stderr)
+            return
+        except (OSError, HTTPException) as err:  # urllib.error.URLError is a subclass of OSError
+            if retry >= DOWNLOAD_RETRIES:
+                raise
+            logger.warning('Download error at %s Bytes: %s (retry %i)', position, err, retry + 1)
+            time.sleep(retry + 1)
+
+
+def check_tar_member(member: tarfile.TarInfo, dst_path: Path):
+    """
+    Reject members outside of dst_path, links pointing outside of it and special files.
+    Used if the "data" extraction filter of tarfile is not available.
+    """
+    if member.name.startswith('/') or '..' in Path(member.name).parts:
+        raise tarfile.TarError(f'Unsafe path in archive: {member.name!r}')
+    if not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+        raise tarfile.TarError(f'Special file in archive: {member.name!r}')
+    if member.issym() or member.islnk():
+        if member.linkname.startswith('/'):
+            raise tarfile.TarError(f'Absolute link in archive: {member.name!r} -> {member.linkname!r}')
+        base_path = dst_path / Path(member.name).parent if member.issym() else dst_path
+        target_path = os.path.normpath(base_path / member.linkname)
+        if os.path.commonpath([target_path, dst_path]) != str(dst_path):
+            raise tarfile.TarError(f'Link outside of archive: {member.name!r} -> {member.linkname!r}')
+
+
+def spool_archive(*, chunks, file_path: Path, hash_name: str, hash_value: str | None):
+    """
+    Write the chunks into file_path and verify the hash, before anything is extracted.
+    """
+    file_hash = hashlib.new(hash_name)
+    with file_path.open('wb') as f:
+        for chunk in chunks:
+            file_hash.update(chunk)
+            f.write(chunk)
+    if hash_value:
+        digest = file_hash.hexdigest()
+        assert digest == hash_value, f'{digest=} != {hash_value=}'
+        print(f'{hash_name} checksum verified: {digest!r}, ok.', file=sys.stderr)
+    return iter_file(file_path)
+
+
+def extract_archive(*, chunks, compress_program: str, dst_path: Path, hash_name: str, hash_value: str | None):
+    """DocWrite: setup_python.md ## Workflow - 5. Extract Archive
+    The archive is hashed, decompressed and extracted in one pass, while it's read (or downloaded),
+    with the "data" extraction filter of tarfile (Python 3.12+ and security backports).
+    The hash value is checked after the archive was completely read, the caller removes `dst_path` on errors.
+    Without the "data" filter, the archive is written to a temporary file and verified first,
+    the members are checked before they are extracted.
+    """
+    if not hasattr(tarfile, 'data_filter'):
+        with tempfile.TemporaryDirectory(prefix='setup_python_') as temp_dir:
+            chunks = spool_archive(
+                chunks=chunks, file_path=Path(temp_dir) / 'archive', hash_name=hash_name, hash_value=hash_value
+            )
+            _extract_archive(chunks=chunks, compress_program=compress_program, dst_path=dst_path)
+        return
+
+    file_hash = hashlib.new(hash_name)
+
+    def hashed_chunks():
+        for chunk in chunks:
+            file_hash.update(chunk)
+            yield chunk
+
+    _extract_archive(chunks=hashed_chunks(), compress_program=compress_program, dst_path=dst_path)
+
+    if hash_value:
+        digest = file_hash.hexdigest()
+        logger.debug('Check %s hash...', digest)
+        assert digest == hash_value, f'{digest=} != {hash_value=}'
+        print(f'{hash_name} checksum verified: {digest!r}, ok.', file=sys.stderr)
+
+
+def _extract_archive(*, chunks, compress_program: str, dst_path: Path):
+    process = subprocess.Popen([compress_program, '-dc'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    feed_errors = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except Exception as err:  # noqa: BLE001 - Re-raised by the main thread, see below
+            feed_errors.append(err)
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    def members(tar):
+        for member in tar:
+            check_tar_member(member, dst_path)
+            yield member
+
+    try:
+        with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(dst_path, filter='data')
+            else:
+                tar.extractall(dst_path, members=members(tar))
+        # Read the padding after the end of the tar archive:
+        while process.stdout.read(DOWNLOAD_CHUNK_SIZE):
+            pass
+    except BaseException:
+        process.kill()
+        feeder.join()
+        if feed_errors and not isinstance(feed_errors[0], BrokenPipeError):
+            # e.g.: A network error is the real reason for a broken archive.
+            # A BrokenPipeError is only the result of the killed process.
+            raise feed_errors[0]
+        raise
+    finally:
+        process.stdout.close()
+        process.wait()
+        feeder.join()
+
+    if feed_errors and not isinstance(feed_errors[0], BrokenPipeError):
+        raise feed_errors[0]
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+    if feed_errors:
+        raise feed_errors[0]
+
+
+def activate_python(*, src_path: Path, dest_path: Path):
+    """DocWrite: setup_python.md ## Workflow - 6. Setup Python
+    `~/.local/pythonX.XX` is a symlink to a versioned directory, e.g.: `~/.local/.pythonX.XX-<random>/python`
+    The symlink will be replaced atomically, so there is no moment without a usable Python.
+    Only the current and the previous versioned directories are kept.
+    """
+    local_path = dest_path.parent
+    prefix = f'.{dest_path.name}-'
+
+    if dest_path.is_dir() and not dest_path.is_symlink():
+        # Migrate a directory from older versions of this script:
+        legacy_path = Path(tempfile.mkdtemp(prefix=prefix, dir=local_path))
+        legacy_path.chmod(0o755)
+        logger.info('Move existing %s to %s ...', dest_path, legacy_path)
+        dest_path.rename(legacy_path / 'python')
+        dest_path.symlink_to(legacy_path.relative_to(local_path) / 'python')
+
+    keep_names = {src_path.parent.name}
+    if dest_path.is_symlink():
+        keep_names.add(Path(os.readlink(dest_path)).parts[0])
+
+    temp_link_path = local_path / f'{prefix}link'
+    if temp_link_path.is_symlink():
+        temp_link_path.unlink()
+    temp_link_path.symlink_to(src_path.relative_to(local_path))
+    logger.debug('Link %s to %s ...', dest_path, src_path)
+    os.replace(temp_link_path, dest_path)
+
+    for old_path in local_path.glob(f'{prefix}*'):
+        if old_path.name not in keep_names and old_path.is_dir() and not old_path.is_symlink():
+            logger.info('Remove old %s ...', old_path)
+            shutil.rmtree(old_path)
+
+
+class ArchiveCache:
+    """DocWrite: setup_python.md ## Archive cache
+    Downloaded archives can be stored in a cache directory (see `--cache-dir`).
+    The archives are stored by their hash value, e.g.: `<sha256>.tar.zst`
+    and the hash value will be verified on every use. Information about the archive is stored
+    in a JSON file next to it, e.g.: `<sha256>.json`
+
+    With `--offline` the newest matching archive from the cache will be installed, without any network access.
+    The hash value of such an archive comes from the JSON file, so only a cache directory and JSON files
+    of the current user, that no other user can change, are used for it.
+    """
+
+    def __init__(self, cache_path: Path):
+        self.cache_path = cache_path
+        self.cache_path.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    @property
+    def download_path(self) -> Path:
+        download_path = self.cache_path / '.download'
+        download_path.mkdir(mode=0o700, exist_ok=True)
+        return download_path
+
+    def get(self, *, hash_name: str, hash_value: str, extension: str, verify: bool = True) -> Path | None:
+        archive_path = self.cache_path / f'{hash_value}{extension}'
+        if not archive_path.is_file():
+            logger.debug('Archive %s not in cache', archive_path.name)
+            return None
+        if not verify:
+            # The caller checks the hash while reading the archive
+            return archive_path
+        file_hash = hash_file(file_path=archive_path, hash_name=hash_name)
+        if file_hash != hash_value:
+            logger.warning('Ignore cached archive %s with wrong hash: %s', archive_path, file_hash)
+            return None
+        logger.info('Use cached archive %s', archive_path)
+        return archive_path
+
+    def add(self, *, file_path: Path, hash_value: str, extension: str, info: dict) -> Path:
+        archive_path = self.cache_path / f'{hash_value}{extension}'
+        info_path = self.cache_path / f'{hash_value}.json'
+        try:
+            os.replace(file_path, archive_path)
+            info_path.write_text(json.dumps(info, indent=4, ensure_ascii=False))
+        except PermissionError as err:
+            # e.g.: The cache directory is not writeable by the current user
+            logger.warning('Can not store %s in cache: %s', file_path, err)
+            return file_path
+        archive_path.chmod(0o600)
+        info_path.chmod(0o600)
+        logger.info('Archive stored in cache: %s', archive_path)
+        return archive_path
+
+    @staticmethod
+    def is_trusted(path: Path) -> bool:
+        """
+        Owned by the current user and not writeable by the group or others.
+        """
+        stat = path.stat()
+        return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+    def find(self, *, major_version: str, archive_extension: str, host: Host) -> tuple[Path, dict] | None:
+        """
+        Return the newest cached archive with the best score for the host.
+        """
+        if not self.is_trusted(self.cache_path):
+            logger.warning('Ignore cache directory %s, it can be changed by other users', self.cache_path)
+            return None
+
+        candidates = []
+        for info_path in self.cache_path.glob('*.json'):
+            if not self.is_trusted(info_path):
+                logger.warning('Ignore cache info %s, it can be changed by other users', info_path)
+                continue
+            try:
+                info = json.loads(info_path.read_text())
+            except ValueError:
+                logger.warning('Ignore invalid cache info %s', info_path)
+                continue
+            if info.get('major_version') != major_version or info.get('archive_extension') != archive_extension:
+                continue
+            if (score := score_variant(host, info['name'])) is not None:
+                candidates.append(((info['tag'], score), info))
+
+        for _, info in sorted(candidates, key=lambda candidate: candidate[0], reverse=True):
+            archive_path = self.get(
+                hash_name=info['hash_name'],
+                hash_value=info['hash_value'],
+                extension=info['archive_extension'],
+            )
+            if archive_path:
+                return archive_path, info
+
+        logger.info('No cached archive found for Python %s on %s', major_version, host)
+        return None
+
+
+class MetadataCache:
+    """DocWrite: setup_python.md ## Metadata cache
+    The release data from the GitHub API is cached in `$XDG_CACHE_HOME/setup_python/` (default: `~/.cache/setup_python/`).
+    Within the TTL (see `--metadata-ttl`) the cached data will be used without any request.
+    After that, a conditional request with the "ETag" is made, so unchanged data will not be transferred again.
+    """
+
+    def __init__(self, *, cache_path: Path, ttl: int):
+        self.cache_path = cache_path
+        self.ttl = ttl
+
+    @classmethod
+    def default_path(cls) -> Path:
+        if xdg_cache_home := os.environ.get('XDG_CACHE_HOME'):
+            return Path(xdg_cache_home) / 'setup_python'
+        return Path.home() / '.cache' / 'setup_python'
+
+    def fetch_json(self, url: str) -> dict:
+        cache_file = self.cache_path / f'{hashlib.sha256(url.encode()).hexdigest()}.json'
+
+        entry = None
+        if cache_file.is_file():
+            try:
+                entry = json.loads(cache_file.read_text())
+            except ValueError:
+                logger.warning('Ignore invalid cache file %s', cache_file)
+            else:
+                if entry.get('url') != url:
+                    entry = None
+
+        headers = {}
+        if entry:
+            age = time.time() - entry['timestamp']
+            if 0 <= age < self.ttl:
+                logger.info('Use cached data of %s (age: %i sec.)', url, age)
+                return entry['data']
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+
+        try:
+            with urlopen(url, headers=headers) as response:
+                data = json.loads(response.read())
+                etag = response.headers.get('ETag')
+        except error.HTTPError as err:
+            if err.code != 304 or not entry:
+                raise
+            logger.info('%s not modified: Use cached data', url)
+            data, etag = entry['data'], entry.get('etag')
+
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        temp_file = cache_file.with_name(f'{cache_file.name}.tmp')
+        temp_file.write_text(json.dumps(dict(url=url, etag=etag, timestamp=time.time(), data=data)))
+        os.replace(temp_file, cache_file)
+        return data
+
+
 def removesuffix(text: str, suffix: str) -> str:
     assert text.endswith(suffix), f'{text=} does not end with {suffix=}'
     return text[: -len(suffix)]
@@ -155,73 +632,179 @@ def verbose_check_output(args) -> str:
     return completed_process.stdout.strip()
 
 
-def get_platform_parts():
+def get_x86_64_level() -> int:
     """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
-    See: https://gregoryszorc.com/docs/python-build-standalone/main/running.html
-    """
-    parts = [sys.platform]
-    abi = 'gnu' if any(platform.libc_ver()) else 'musl'
-    logger.debug('Use %r ABI', abi)
-    parts.append(abi)
+    For `x86-64` Linux we check the CPU flags from `/proc/cpuinfo` to determine the micro-architecture level."""
+    try:
+        contents = Path('/proc/cpuinfo').read_text()
+    except OSError:
+        return 1
+
+    # Based on https://github.com/pypa/hatch/blob/master/src/hatch/python/resolve.py
+    # See https://clang.llvm.org/docs/UsersManual.html#x86 for the
+    # instructions for each architecture variant and
+    # https://github.com/torvalds/linux/blob/master/arch/x86/include/asm/cpufeatures.h
+    # for the corresponding Linux flags
+    v2_flags = {'cx16', 'lahf_lm', 'popcnt', 'pni', 'sse4_1', 'sse4_2', 'ssse3'}
+    v3_flags = {'avx', 'avx2', 'bmi1', 'bmi2', 'f16c', 'fma', 'movbe', 'xsave'} | v2_flags
+    v4_flags = {'avx512f', 'avx512bw', 'avx512cd', 'avx512dq', 'avx512vl'} | v3_flags
+
+    cpu_flags = set()
+    for line in contents.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip() == 'flags':
+            cpu_flags |= set(value.strip().split())
+
+    logger.debug('CPU flags: %s', ', '.join(sorted(cpu_flags)))
+
+    for level, level_flags in ((4, v4_flags), (3, v3_flags), (2, v2_flags)):
+        if missing_flags := level_flags - cpu_flags:
+            logger.debug('Missing v%i flags: %s', level, ', '.join(sorted(missing_flags)))
+        else:
+            return level
+    return 1
 
-    arch = platform.machine().lower()
-    if sys.platform == 'linux' and arch == 'x86_64':
+
+@dataclasses.dataclass
+class Host:
+    os: str  # e.g.: 'linux'
+    arch: str  # e.g.: 'x86_64', 'aarch64', 'armv7'
+    cpu_level: int  # x86-64 micro-architecture level 1-4, 0 for all other architectures
+    libc: str | None  # 'gnu' or 'musl' on Linux
+    freethreaded: bool = False
+
+    @classmethod
+    def detect(cls, *, freethreaded: bool = False) -> Host:
         """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
-        For `x86-64` Linux we check the CPU flags from `/proc/cpuinfo` to determine the best variant."""
-        try:
-            contents = Path('/proc/cpuinfo').read_text()
-        except OSError:
-            pass
-        else:
-            # Based on https://github.com/pypa/hatch/blob/master/src/hatch/python/resolve.py
-            # See https://clang.llvm.org/docs/UsersManual.html#x86 for the
-            # instructions for each architecture variant and
-            # https://github.com/torvalds/linux/blob/master/arch/x86/include/asm/cpufeatures.h
-            # for the corresponding Linux flags
-            v2_flags = {'cx16', 'lahf_lm', 'popcnt', 'pni', 'sse4_1', 'sse4_2', 'ssse3'}
-            v3_flags = {'avx', 'avx2', 'bmi1', 'bmi2', 'f16c', 'fma', 'movbe', 'xsave'} | v2_flags
-            v4_flags = {'avx512f', 'avx512bw', 'avx512cd', 'avx512dq', 'avx512vl'} | v3_flags
-
-            cpu_flags = set()
-            for line in contents.splitlines():
-                key, _, value = line.partition(':')
-                if key.strip() == 'flags':
-                    cpu_flags |= set(value.strip().split())
-
-            logger.debug('CPU flags: %s', ', '.join(sorted(cpu_flags)))
-
-            missing_v4_flags = v4_flags - cpu_flags
-            if not missing_v4_flags:
-                arch = 'x86_64_v4'
-            else:
-                logger.debug('Missing v4 flags: %s', ', '.join(sorted(missing_v4_flags)))
-                missing_v3_flags = v3_flags - cpu_flags
-                if not missing_v3_flags:
-                    arch = 'x86_64_v3'
-                else:
-                    logger.debug('Missing v3 flags: %s', ', '.join(sorted(missing_v3_flags)))
-                    missing_v2_flags = v2_flags - cpu_flags
-                    if not missing_v2_flags:
-                        arch = 'x86_64_v2'
-                    else:
-                        logger.debug('Missing v2 flags: %s', ', '.join(sorted(missing_v2_flags)))
+        See: https://gregoryszorc.com/docs/python-build-standalone/main/running.html
+        """
+        arch = platform.machine().lower()
+        arch = {'amd64': 'x86_64', 'arm64': 'aarch64', 'armv7l': 'armv7'}.get(arch, arch)
+
+        libc = None
+        if sys.platform == 'linux':
+            libc = 'gnu' if any(platform.libc_ver()) else 'musl'
+
+        cpu_level = 0
+        if sys.platform == 'linux' and arch == 'x86_64':
+            cpu_level = get_x86_64_level()
+
+        host = cls(os=sys.platform, arch=arch, cpu_level=cpu_level, libc=libc, freethreaded=freethreaded)
+        logger.info('Host: %s', host)
+        return host
 
-    logger.info('Use arch: %r', arch)
-    parts.append(arch)
-    return parts
 
+VARIANT_RE = re.compile(
+    r'^cpython-(?P<version>[^+]+)\+(?P<tag>\d+)-'
+    r'(?P<arch>[a-z0-9_]+?)(?:_v(?P<cpu_level>\d))?-(?P<vendor>[a-z]+)-(?P<os>[a-z]+)'
+    r'(?:-(?P<libc>gnu[a-z]*|musl|msvc))?'
+    r'-(?P<build>.+)$'
+)
 
-def get_best_variant(names):
+
+@dataclasses.dataclass
+class Variant:
+    """
+    The parsed name of a python-build-standalone archive, e.g.:
+    cpython-3.13.0+20241016-x86_64_v3-unknown-linux-gnu-freethreaded+pgo+lto-full
+    """
+
+    name: str
+    os: str
+    arch: str
+    cpu_level: int
+    libc: str | None
+    flags: set[str]  # e.g.: {'freethreaded', 'pgo', 'lto'}
+
+    @classmethod
+    def parse(cls, name: str) -> Variant | None:
+        if not (match := VARIANT_RE.match(name)):
+            logger.debug('Ignore unknown variant name: %r', name)
+            return None
+        arch = match.group('arch')
+        cpu_level = int(match.group('cpu_level') or (1 if arch == 'x86_64' else 0))
+        build_flags = match.group('build').split('-')[0]
+        return cls(
+            name=name,
+            os=match.group('os'),
+            arch=arch,
+            cpu_level=cpu_level,
+            libc=match.group('libc'),
+            flags=set(build_flags.split('+')),
+        )
+
+    @property
+    def optimization(self) -> str:
+        return '+'.join(flag for flag in ('pgo', 'lto') if flag in self.flags)
+
+
+def score_platform(host: Host, variant: Variant) -> int | None:
+    if variant.os != host.os or variant.arch != host.arch:
+        return None
+    if host.libc and not (variant.libc or '').startswith(host.libc):
+        return None
+    return 0
+
+
+def score_build(host: Host, variant: Variant) -> int | None:
+    """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
+    The "debug" builds are ignored. Free-threaded builds are only used if requested via `--freethreaded`."""
+    if 'debug' in variant.flags:
+        return None
+    if ('freethreaded' in variant.flags) != host.freethreaded:
+        return None
+    return 0
+
+
+def score_optimization(host: Host, variant: Variant) -> int | None:
     """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
-    We choose the optimized variant based on the priority list:
+    The optimization of the build is rated by the priority list:
     DocWriteMacro: manageprojects.tests.docwrite_macros_setup_python.optimization_priority
     """
-    for optimization in OPTIMIZATION_PRIORITY:
-        for name in names:
-            if optimization in name:
-                return name
-    logger.warning('No optimization found in names: %r', names)
-    return sorted(names)[0]
+    if variant.optimization in OPTIMIZATION_PRIORITY:
+        return len(OPTIMIZATION_PRIORITY) - OPTIMIZATION_PRIORITY.index(variant.optimization)
+    return 0
+
+
+def score_cpu_level(host: Host, variant: Variant) -> int | None:
+    """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
+    The highest x86-64 micro-architecture level, that the CPU supports, is preferred."""
+    if variant.cpu_level > host.cpu_level:
+        return None
+    return variant.cpu_level
+
+
+"""DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
+Every archive is scored by these functions. A function returns `None` if the archive can't be used on the host.
+The scores are compared in this order, so the build optimization counts more than the CPU level."""
+VARIANT_SCORERS = [score_platform, score_build, score_optimization, score_cpu_level]
+
+
+def score_variant(host: Host, name: str) -> tuple[int, ...] | None:
+    if not (variant := Variant.parse(name)):
+        return None
+    scores = []
+    for scorer in VARIANT_SCORERS:
+        score = scorer(host, variant)
+        if score is None:
+            logger.debug('%s: %r is not usable', scorer.__name__, name)
+            return None
+        scores.append(score)
+    return tuple(scores)
+
+
+def get_best_variant(names, *, host: Host) -> tuple[str, tuple[int, ...]]:
+    """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
+    The usable archive with the best score is chosen. The choice is stored in `info.json`."""
+    scored = {}
+    for name in names:
+        if (score := score_variant(host, name)) is not None:
+            logger.debug('Score %s: %r', score, name)
+            scored[name] = score
+    if not scored:
+        raise LookupError(f'No usable variant for {host} in: {sorted(names)!r}')
+    best_variant = max(scored, key=lambda name: (scored[name], name))
+    return best_variant, scored[best_variant]
 
 
 def get_python_version(python_bin: str | Path) -> str | None:
@@ -232,6 +815,17 @@ def get_python_version(python_bin: str | Path) -> str | None:
         return full_version
 
 
+def get_installed_info(python_path: Path) -> dict:
+    info_file_path = python_path / 'info.json'
+    try:
+        return json.loads(info_file_path.read_text())
+    except FileNotFoundError:
+        logger.debug('No %s found', info_file_path)
+    except ValueError as err:
+        logger.warning('Ignore invalid %s: %s', info_file_path, err)
+    return {}
+
+
 def check_file_in_path(file_name: str):
     if not shutil.which(file_name):
         logger.error('Executable %r not found in PATH! (Hint: Add ~/.local/bin to PATH)', file_name)
@@ -245,11 +839,77 @@ class DownloadInfo:
     size: int
 
 
+@dataclasses.dataclass
+class ReleaseArchive:
+    tag: str
+    name: str  # e.g.: cpython-3.13.0rc2+20240909-x86_64_v3-unknown-linux-gnu-pgo-full
+    score: tuple[int, ...]
+    archive_info: DownloadInfo
+    hash_url: str
+
+
+def get_latest_tag(*, metadata_cache: MetadataCache) -> str:
+    """DocWrite: setup_python.md ## Workflow - 2. Collect latest release data
+    We fetch the latest release data from the GitHub API:
+    DocWriteMacro: manageprojects.tests.docwrite_macros_setup_python.lastest_release_url"""
+    data = metadata_cache.fetch_json(LASTEST_RELEASE_URL)
+    logger.debug('Latest release data: %r', data)
+    return data['tag']
+
+
+def get_release_archive(
+    *,
+    metadata_cache: MetadataCache,
+    tag: str,
+    major_version: str,
+    host: Host,
+    archive_extension: str,
+    archive_hash_extension: str,
+) -> ReleaseArchive:
+    release_url = f'{GITHUB_API_URL}/repos/{GUTHUB_PROJECT}/releases/tags/{tag}'
+    release_data = metadata_cache.fetch_json(release_url)
+    assets = release_data['assets']
+
+    archive_infos = {}
+    hash_urls = {}
+
+    for asset in assets:
+        full_name = asset['name']
+        if not full_name.startswith(f'cpython-{major_version}.'):
+            # Ignore all other major versions
+            continue
+
+        if full_name.endswith(archive_extension):
+            name = removesuffix(full_name, archive_extension)
+            archive_infos[name] = DownloadInfo(url=asset['browser_download_url'], size=asset['size'])
+        elif full_name.endswith(archive_hash_extension):
+            name = removesuffix(full_name, archive_hash_extension)
+            hash_urls[name] = asset['browser_download_url']
+
+    assert archive_infos, f'No "{archive_extension}" found in {assets=}'
+    assert hash_urls, f'No "{archive_hash_extension}" found in {assets=}'
+
+    assert archive_infos.keys() == hash_urls.keys(), f'{archive_infos.keys()=} != {hash_urls.keys()=}'
+
+    best_variant, score = get_best_variant(archive_infos.keys(), host=host)
+    return ReleaseArchive(
+        tag=tag,
+        name=best_variant,
+        score=score,
+        archive_info=archive_infos[best_variant],
+        hash_url=hash_urls[best_variant],
+    )
+
+
 def setup_python(
     *,
     major_version: str,
     delete_temp: bool = True,
     force_update: bool = False,
+    cache_path: Path | None = None,
+    offline: bool = False,
+    metadata_ttl: int = METADATA_TTL,
+    freethreaded: bool = False,
 ):
     """DocWrite: setup_python.md # Boot Redistributable Python
     The download will be only done, if the system Python is not the same major version as requested
@@ -311,51 +971,76 @@ def setup_python(
     archive_extension = f'.tar.{compress_extension}'
     archive_hash_extension = f'.tar.{compress_extension}.{HASH_NAME}'
 
-    filters = [archive_extension, *get_platform_parts()]
-    logger.debug('Use filters: %s', filters)
-
-    """DocWrite: setup_python.md ## Workflow - 2. Collect latest release data
-    We fetch the latest release data from the GitHub API:
-    DocWriteMacro: manageprojects.tests.docwrite_macros_setup_python.lastest_release_url"""
-    data = fetch_json(LASTEST_RELEASE_URL)
-    logger.debug('Latest release data: %r', data)
-    tag = data['tag']
-    release_url = f'https://api.github.com/repos/{GUTHUB_PROJECT}/releases/tags/{tag}'
-    release_data = fetch_json(release_url)
-    assets = release_data['assets']
-
-    archive_infos = {}
-    hash_urls = {}
+    host = Host.detect(freethreaded=freethreaded)
 
-    for asset in assets:
-        full_name = asset['name']
-        if '-debug-' in full_name:
-            """DocWrite: setup_python.md ## Workflow - 3. Obtaining optimized Python distribution
-            The "debug" build are ignored."""
-            continue
-
-        if not full_name.startswith(f'cpython-{major_version}.'):
-            # Ignore all other major versions
-            continue
-
-        if not all(f in full_name for f in filters):
-            # Ignore incompatible assets
-            continue
-
-        if full_name.endswith(archive_extension):
-            name = removesuffix(full_name, archive_extension)
-            archive_infos[name] = DownloadInfo(url=asset['browser_download_url'], size=asset['size'])
-        elif full_name.endswith(archive_hash_extension):
-            name = removesuffix(full_name, archive_hash_extension)
-            hash_urls[name] = asset['browser_download_url']
-
-    assert archive_infos, f'No "{archive_extension}" found in {assets=}'
-    assert hash_urls, f'No "{archive_hash_extension}" found in {assets=}'
+    archive_cache = ArchiveCache(cache_path) if cache_path else None
+    cached_archive = None
+    if offline:
+        if not archive_cache:
+            raise ValueError('Offline mode needs a cache directory!')
+        cached_archive = archive_cache.find(
+            major_version=major_version, archive_extension=archive_extension, host=host
+        )
+        if not cached_archive:
+            raise FileNotFoundError(f'No cached Python {major_version} archive found in {cache_path}')
+    else:
+        metadata_cache = MetadataCache(cache_path=MetadataCache.default_path(), ttl=metadata_ttl)
+        try:
+            tag = get_latest_tag(metadata_cache=metadata_cache)
+
+            """DocWrite: setup_python.md ## Workflow - 4. Check existing Python
+            If the local Python was installed from the latest release, we skip fetching the release assets."""
+            installed_info = get_installed_info(Path.home() / '.local' / final_file_name)
+            if (
+                existing_python_bin
+                and installed_info.get('tag') == tag
+                and installed_info.get('host') == dataclasses.asdict(host)
+            ):
+                logger.info(
+                    'Local Python v%s is from latest release %s: Return path %r of it.',
+                    existing_version,
+                    tag,
+                    existing_python_bin,
+                )
+                if force_update:
+                    logger.info('Force update requested: Continue with download ...')
+                else:
+                    check_file_in_path(final_file_name)
+                    return Path(existing_python_bin)
 
-    assert archive_infos.keys() == hash_urls.keys(), f'{archive_infos.keys()=} != {hash_urls.keys()=}'
+            release_archive = get_release_archive(
+                metadata_cache=metadata_cache,
+                tag=tag,
+                major_version=major_version,
+                host=host,
+                archive_extension=archive_extension,
+                archive_hash_extension=archive_hash_extension,
+            )
+        except (OSError, HTTPException) as err:
+            """DocWrite: setup_python.md ## Archive cache
+            If the release data can't be fetched, the newest matching archive from the cache will be used."""
+            if archive_cache and (
+                cached_archive := archive_cache.find(
+                    major_version=major_version, archive_extension=archive_extension, host=host
+                )
+            ):
+                logger.warning('Fetching release data failed (%s): Use cached archive', err)
+            else:
+                raise
+
+    if cached_archive:
+        cached_archive_path, cached_info = cached_archive
+        release_archive = ReleaseArchive(
+            tag=cached_info['tag'],
+            name=cached_info['name'],
+            score=score_variant(host, cached_info['name']),
+            archive_info=DownloadInfo(url=cached_info['archive_url'], size=cached_info['size']),
+            hash_url=cached_info['hash_url'],
+        )
 
-    best_variant = get_best_variant(archive_infos.keys())
-    logger.debug('Use best variant: %r', best_variant)
+    tag = release_archive.tag
+    best_variant = release_archive.name
+    logger.info('Use best variant: %r (score: %s)', best_variant, release_archive.score)
 
     """DocWrite: setup_python.md ## Workflow - 4. Check existing Python
     If the latest Python version is already installed, we skip the download."""
@@ -383,45 +1068,82 @@ def setup_python(
 
     """DocWrite: setup_python.md ## Workflow - 4. Download and verify Archive
     If the latest Python version is already installed, we skip the download."""
-    archive_info: DownloadInfo = archive_infos[best_variant]
+    archive_info: DownloadInfo = release_archive.archive_info
     logger.debug('Archive info: %s', archive_info)
 
-    hash_url: str = hash_urls[best_variant]
+    hash_url: str = release_archive.hash_url
     logger.debug('Hash URL: %s', hash_url)
 
-    # Download checksum file:
-    hash_value = fetch(hash_url).decode().strip()
+    if cached_archive:
+        hash_value = cached_info['hash_value']
+    else:
+        # Download checksum file:
+        hash_value = fetch(hash_url).decode().strip()
     logger.debug('%s hash value: %s', HASH_NAME, hash_value)
 
     """DocWrite: setup_python.md ## Workflow - 4. Download and verify Archive
-    Download will be done in a temporary directory."""
-    with TemporaryDirectory(prefix=TEMP_PREFIX, delete=delete_temp) as temp_path:
+    Without a cache directory, the archive will not be stored on disk: It's extracted while downloading."""
+    if cached_archive:
+        archive_path, check_hash = cached_archive_path, None  # Verified by ArchiveCache.find()
+    elif archive_cache and (
+        archive_path := archive_cache.get(
+            hash_name=HASH_NAME, hash_value=hash_value, extension=archive_extension, verify=False
+        )
+    ):
+        check_hash = hash_value
+    elif archive_cache:
         """DocWrite: setup_python.md ## Workflow - 4. Download and verify Archive
         We check the file hash after downloading the archive."""
-        archive_temp_path = download(
+        archive_path = download(
             url=archive_info.url,
-            dst_path=temp_path,
+            dst_path=archive_cache.download_path,
             total_size=archive_info.size,
             hash_name=HASH_NAME,
             hash_value=hash_value,
+            filename=f'{hash_value}{archive_extension}',
+        )
+        archive_path = archive_cache.add(
+            file_path=archive_path,
+            hash_value=hash_value,
+            extension=archive_extension,
+            info=dict(
+                name=best_variant,
+                archive_name=f'{best_variant}{archive_extension}',
+                archive_extension=archive_extension,
+                tag=tag,
+                major_version=major_version,
+                archive_url=archive_info.url,
+                hash_url=hash_url,
+                hash_name=HASH_NAME,
+                hash_value=hash_value,
+                size=archive_info.size,
+            ),
         )
+        check_hash = None  # Verified by download()
+    else:
+        archive_path, check_hash = None, hash_value
 
-        # Extract .tar.zstd archive file into temporary directory:
-        logger.debug('Extract %s into %s ...', archive_temp_path, temp_path)
-        run(
-            [
-                'tar',
-                f'--use-compress-program={compress_program}',
-                '--extract',
-                '--file',
-                archive_temp_path,
-                '--directory',
-                temp_path,
-            ],
-            check=True,
+    if archive_path:
+        logger.debug('Extract %s ...', archive_path)
+        chunks = iter_file(archive_path)
+    else:
+        logger.debug('Download and extract %s ...', archive_info.url)
+        chunks = iter_url(url=archive_info.url, total_size=archive_info.size)
+
+    """DocWrite: setup_python.md ## Workflow - 5. Extract Archive
+    The archive is extracted into a new directory next to the final destination, e.g.: `~/.local/.pythonX.XX-<random>`"""
+    staging_path = Path(tempfile.mkdtemp(prefix=f'.{final_file_name}-', dir=local_path))
+    staging_path.chmod(0o755)
+    try:
+        extract_archive(
+            chunks=chunks,
+            compress_program=compress_program,
+            dst_path=staging_path,
+            hash_name=HASH_NAME,
+            hash_value=check_hash,
         )
 
-        src_path = temp_path / 'python'
+        src_path = staging_path / 'python'
         assert_is_dir(src_path)
 
         """DocWrite: setup_python.md ## Workflow - 6. Setup Python
@@ -430,7 +1152,7 @@ def setup_python(
         * `./python/install/bin/python3`
         * `./python/bin/python3`
 
-        We handle both cases and move all contents to the final destination.
+        We handle both cases.
         """
         has_install_dir = (src_path / 'install').is_dir()
         if has_install_dir:
@@ -448,7 +1170,9 @@ def setup_python(
         info = dict(
             download_by=__file__,
             download_dt=datetime.datetime.now().isoformat(),
-            download_filters=filters,
+            host=dataclasses.asdict(host),
+            variant=best_variant,
+            variant_score=release_archive.score,
             major_version=major_version,
             tag=tag,
             archive_url=archive_info.url,
@@ -459,15 +1183,17 @@ def setup_python(
             pip_version_info=pip_version_into,
         )
         info_file_path.write_text(json.dumps(info, indent=4, ensure_ascii=False))
+    except BaseException:
+        if delete_temp:
+            shutil.rmtree(staging_path, ignore_errors=True)
+        else:
+            logger.info('Keep %s', staging_path)
+        raise
 
-        """DocWrite: setup_python.md ## Workflow - 6. Setup Python
-        The extracted Python will be moved to the final destination in `~/.local/pythonX.XX/`."""
-        dest_path = Path.home() / '.local' / final_file_name
-        logger.debug('Move %s to %s ...', src_path, dest_path)
-        if dest_path.exists():
-            logger.info('Remove existing %r ...', dest_path)
-            shutil.rmtree(dest_path)
-        shutil.move(src_path, dest_path)
+    """DocWrite: setup_python.md ## Workflow - 6. Setup Python
+    The extracted Python will be activated as the final destination `~/.local/pythonX.XX/`."""
+    dest_path = local_path / final_file_name
+    activate_python(src_path=src_path, dest_path=dest_path)
 
     if has_install_dir:
         python_home_path = dest_path / 'install'
@@ -534,13 +1260,35 @@ def get_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         '--skip-temp-deletion',
         action='store_true',
-        help='Skip deletion of temporary files',
+        help='Keep the extracted files, if the setup failed',
     )
     parser.add_argument(
         '--force-update',
         action='store_true',
         help='Update local Python interpreter, even if it is up-to-date',
     )
+    parser.add_argument(
+        '--cache-dir',
+        type=Path,
+        default=None,
+        help='Store downloaded archives in this directory and reuse them',
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Install the newest matching archive from the cache directory, without network access',
+    )
+    parser.add_argument(
+        '--metadata-ttl',
+        type=int,
+        default=METADATA_TTL,
+        help='Seconds to use cached release data without any request (0: always make a conditional request)',
+    )
+    parser.add_argument(
+        '--freethreaded',
+        action='store_true',
+        help='Use a free-threaded build (without the GIL, Python 3.13+)',
+    )
     return parser
 
 
@@ -559,6 +1307,10 @@ def main(args=None):
         major_version=args.major_version,
         delete_temp=not args.skip_temp_deletion,
         force_update=args.force_update,
+        cache_path=args.cache_dir,
+        offline=args.offline,
+        metadata_ttl=args.metadata_ttl,
+        freethreaded=args.freethreaded,
     )
 
 
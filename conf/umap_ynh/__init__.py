@@ -0,0 +1,3 @@
+"""
+YunoHost integration of uMap: Code used by the settings of this package.
+"""
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class UmapYnhConfig(AppConfig):
+    name = "umap_ynh"
+    verbose_name = "uMap YunoHost integration"
+
+    def ready(self):
+        # "datalayer_index": Connect the signals, that keep the datalayer index up to date.
+        # "versions": Imported lazily by the data storage: Import it now, not from the code of a newer
+        # release installed by an upgrade (upgrade_mode "swap"), while this process is still running.
+        from umap_ynh import datalayer_index, versions  # noqa: F401
@@ -0,0 +1,31 @@
+"""
+ASGI entry point of the uvicorn service, a replacement for "umap.asgi:application"
+that imports the realtime (websocket) application only on the first websocket connection.
+"""
+import os
+
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "umap.settings")
+
+from django.core.asgi import get_asgi_application
+
+
+# Initialize Django ASGI application early to ensure the AppRegistry
+# is populated before importing code that may import ORM models.
+django_asgi_app = get_asgi_application()
+
+
+def get_ws_application():
+    # "umap.sync" pulls in pydantic and the asyncio Redis client, that are only needed for realtime editing:
+    from umap.sync.app import application
+
+    return application
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http":
+        await django_asgi_app(scope, receive, send)
+    elif scope["type"] == "websocket":
+        await get_ws_application()(scope, receive, send)
+    else:
+        raise NotImplementedError(f"Unknown scope type {scope['type']}")
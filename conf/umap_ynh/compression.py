@@ -0,0 +1,57 @@
+"""
+Pre-compressed copies of files, served by nginx via "gzip_static".
+"""
+
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _gzip_copy(src, dst):
+    with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=9, mtime=0) as f_out:
+        shutil.copyfileobj(src, f_out, CHUNK_SIZE)
+
+
+def is_fresh(path: Path, compressed_path: Path) -> bool:
+    """
+    The compressed copy gets the modification time of the original file.
+    """
+    try:
+        return compressed_path.stat().st_mtime_ns == path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def precompress(path: Path, *, force: bool = False) -> Path | None:
+    """
+    Write "<path>.gz" next to the file, if missing or outdated. Returns the path, if written.
+    The file is written into a temporary file and renamed, so nginx will never
+    serve a partly written file.
+    """
+    stat = path.stat()
+    compressed_path = path.with_name(f"{path.name}.gz")
+    if not force and is_fresh(path, compressed_path):
+        return None
+
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{compressed_path.name}.")
+    try:
+        with path.open("rb") as src, os.fdopen(fd, "wb") as dst:
+            _gzip_copy(src, dst)
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(temp_name, settings.FILE_UPLOAD_PERMISSIONS)
+        os.utime(temp_name, ns=(stat.st_mtime_ns, stat.st_mtime_ns))
+        os.replace(temp_name, compressed_path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+    return compressed_path
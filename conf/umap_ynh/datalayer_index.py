@@ -0,0 +1,166 @@
+"""
+Conditional GET of the datalayers, with the datalayer version as ETag:
+
+uMap answers "If-None-Match" / "If-Modified-Since" with 304, without reading the file (see: datalayer_view).
+For maps that everyone can view, nginx answers them itself (see "datalayer" location in nginx.conf):
+settings.YNH_DATALAYER_INDEX_DIR contains one empty file "<map id>/<datalayer uuid>.<version>"
+per datalayer of these maps, kept up to date by the data storage and the Map signals.
+nginx doesn't check the permissions (can_view_map), so an entry must never outlive the public share status:
+Changes that bypass the signals (e.g. QuerySet.update()) are corrected by the daily rebuild (see "cron").
+"""
+
+import logging
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from umap.decorators import can_view_map
+from umap.models import DataLayer, Map
+from umap.views import DataLayerView
+
+
+logger = logging.getLogger(__name__)
+
+# Maps that everyone can view, see: Map.can_view()
+PUBLIC_SHARE_STATUS = (Map.PUBLIC, Map.OPEN)
+
+
+def get_index_dir() -> Path:
+    return Path(settings.YNH_DATALAYER_INDEX_DIR)
+
+
+def get_version(datalayer: DataLayer) -> str | None:
+    # Not the cached "reference_version": In onDatalayerSave() it's still the version before the save,
+    # if it was read before, e.g. by DataLayerUpdate for the "X-Datalayer-Reference" header.
+    version = datalayer.geojson.storage.get_reference_version(datalayer)
+    # The version of the FS storage is the save time in milliseconds, nginx.conf accepts only digits:
+    if version and version.isdigit():
+        return version
+    return None
+
+
+def is_public(datalayer: DataLayer) -> bool:
+    return datalayer.map.share_status in PUBLIC_SHARE_STATUS and datalayer.share_status != DataLayer.DELETED
+
+
+def get_path(datalayer: DataLayer) -> Path | None:
+    """
+    The index entry of the current version of the datalayer, if it's public.
+    """
+    if is_public(datalayer) and (version := get_version(datalayer)):
+        return get_index_dir() / str(datalayer.map_id) / f"{datalayer.pk}.{version}"
+    return None
+
+
+def get_public_datalayers():
+    return DataLayer.objects.filter(map__share_status__in=PUBLIC_SHARE_STATUS).select_related("map")
+
+
+def update_datalayer(datalayer: DataLayer) -> Path | None:
+    """
+    Add the current version of the datalayer to the index, if it's public, and remove the others.
+    """
+    map_dir = get_index_dir() / str(datalayer.map_id)
+    if path := get_path(datalayer):
+        map_dir.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    if map_dir.is_dir():
+        for old_path in map_dir.glob(f"{datalayer.pk}.*"):
+            if old_path != path:
+                old_path.unlink(missing_ok=True)
+    return path
+
+
+def remove_datalayer(datalayer: DataLayer) -> None:
+    map_dir = get_index_dir() / str(datalayer.map_id)
+    if map_dir.is_dir():
+        for path in map_dir.glob(f"{datalayer.pk}.*"):
+            path.unlink(missing_ok=True)
+
+
+def rebuild() -> int:
+    """
+    Write the index of all datalayers and remove outdated entries. Returns the number of entries.
+    """
+    index_dir = get_index_dir()
+    paths = set()
+    for datalayer in get_public_datalayers().iterator():
+        if path := update_datalayer(datalayer):
+            paths.add(path)
+
+    if index_dir.is_dir():
+        for map_dir in index_dir.iterdir():
+            for path in map_dir.iterdir():
+                if path not in paths:
+                    path.unlink()
+            if not any(map_dir.iterdir()):
+                map_dir.rmdir()
+    return len(paths)
+
+
+def find_outdated() -> list[Path]:
+    """
+    The index entries, that nginx must not use: Of maps or datalayers that are not public (anymore),
+    or of an old version. Nothing is changed, see rebuild().
+    """
+    index_dir = get_index_dir()
+    if not index_dir.is_dir():
+        return []
+    paths = {path for datalayer in get_public_datalayers().iterator() if (path := get_path(datalayer))}
+    return sorted(path for path in index_dir.glob("*/*") if path not in paths)
+
+
+@receiver(post_save, sender=Map)
+def update_map(sender, instance, **kwargs):
+    map_dir = get_index_dir() / str(instance.pk)
+    try:
+        if instance.share_status not in PUBLIC_SHARE_STATUS:
+            # e.g.: The map is private now: Remove all its entries, not only the ones of its current datalayers.
+            if map_dir.is_dir():
+                shutil.rmtree(map_dir)
+            return
+        for datalayer in instance.datalayer_set.all():
+            datalayer.map = instance
+            update_datalayer(datalayer)
+    except OSError:
+        # Corrected by the daily rebuild, see "cron":
+        logger.exception("Can't update the datalayer index of map %s", instance.pk)
+
+
+@receiver(post_delete, sender=Map)
+def remove_map(sender, instance, **kwargs):
+    shutil.rmtree(get_index_dir() / str(instance.pk), ignore_errors=True)
+
+
+def get_datalayer_version(request, *args, pk, **kwargs):
+    # Called by condition() for the ETag and the Last-Modified date, query the datalayer only once:
+    if not hasattr(request, "_ynh_datalayer_version"):
+        datalayer = DataLayer.objects.filter(pk=pk).only("pk", "geojson").first()
+        request._ynh_datalayer_version = get_version(datalayer) if datalayer else None
+    return request._ynh_datalayer_version
+
+
+def get_etag(request, *args, **kwargs):
+    if version := get_datalayer_version(request, *args, **kwargs):
+        # Weak: The same version is served gzip compressed or not.
+        return f'W/"{version}"'
+    return None
+
+
+def get_last_modified(request, *args, **kwargs):
+    if version := get_datalayer_version(request, *args, **kwargs):
+        return datetime.fromtimestamp(int(version) / 1000, tz=timezone.utc)
+    return None
+
+
+# Same decorators as uMap's "datalayer_view" and the conditional request handling:
+datalayer_view = can_view_map(
+    cache_control(must_revalidate=True)(
+        condition(etag_func=get_etag, last_modified_func=get_last_modified)(DataLayerView.as_view())
+    )
+)
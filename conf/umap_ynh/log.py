@@ -0,0 +1,154 @@
+"""
+Logging of this package, see "LOGGING" in settings.py:
+
+All loggers write into a queue. A background thread per process passes the records to the real handlers,
+so a request never waits for the log file or the SMTP server.
+"""
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import queue
+import time
+import types
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.log import AdminEmailHandler
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for a queue in the same process: The records are not pickled, so keep "exc_info".
+    The message is formatted now, because the arguments may change until the listener thread handles the record.
+
+    The listener thread must not query the database, e.g.: for the lazy "request.user" or a QuerySet
+    in the local variables of a traceback. So the admin mail of an error with a request or a traceback
+    is rendered now and the "request" attribute is not passed to the listener thread.
+    """
+
+    def __init__(self, queue, targets=()):
+        super().__init__(queue)
+        self.mail_handlers = [target for target in targets if isinstance(target, ThrottledAdminEmailHandler)]
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        request = getattr(record, "request", None)
+        if request is None and not record.exc_info:
+            return record
+
+        record = copy.copy(record)
+        for handler in self.mail_handlers:
+            if settings.ADMINS and record.levelno >= handler.level:
+                try:
+                    record.ynh_admin_mail = handler.render(record)
+                except Exception:  # noqa: BLE001 - The record must still reach the other handlers
+                    handler.handleError(record)
+        if request is not None:
+            del record.request
+        return record
+
+
+def queue_handler(handlers):
+    """
+    Factory for the "()" key of a handler in settings.LOGGING, e.g.:
+
+        "queue": {
+            "()": "umap_ynh.log.queue_handler",
+            "handlers": ["cfg://handlers.log_file", "cfg://handlers.mail_admins"],
+        }
+
+    The referenced handlers must be configured before: dictConfig() configures them sorted by name.
+    """
+    targets = [handlers[index] for index in range(len(handlers))]  # Index access resolves "cfg://" values
+    for target in targets:
+        if not isinstance(target, logging.Handler):
+            raise ValueError(f"Handler {target!r} is not configured before the queue handler")
+
+    handler = LocalQueueHandler(queue.SimpleQueue(), targets)
+    listener = QueueListener(handler.queue, *targets, respect_handler_level=True)
+    listener.start()
+    # Write the queued records on shutdown:
+    atexit.register(listener.stop)
+    return handler
+
+
+class ThrottledAdminEmailHandler(AdminEmailHandler):
+    """
+    Send only one mail per logger, level and exception type within settings.YNH_ADMIN_MAIL_THROTTLE seconds,
+    shared by all workers via the cache.
+    """
+
+    # Fallback, if the cache is not available:
+    _last_sent = {}
+
+    def get_throttle_key(self, record):
+        exc_type = record.exc_info[0].__name__ if record.exc_info else ""
+        source = f"{record.name}:{record.levelno}:{exc_type}"
+        return f"ynh_admin_mail:{hashlib.sha256(source.encode()).hexdigest()}"
+
+    def render(self, record):
+        """
+        Subject, message and HTML message of the mail, as AdminEmailHandler.emit() would send it.
+        Called by LocalQueueHandler.prepare() in the thread of the request.
+        """
+        rendered = []
+
+        def send_mail(self, subject, message, *args, html_message=None, **kwargs):
+            rendered.append((subject, message, html_message))
+
+        renderer = copy.copy(self)
+        renderer.send_mail = types.MethodType(send_mail, renderer)
+        AdminEmailHandler.emit(renderer, record)
+        return rendered[0]
+
+    def is_throttled(self, record):
+        timeout = settings.YNH_ADMIN_MAIL_THROTTLE
+        key = self.get_throttle_key(record)
+        try:
+            return not cache.add(key, 1, timeout=timeout)
+        except Exception:  # noqa: BLE001 - Any error of the cache backend (e.g.: Redis is down)
+            now = time.monotonic()
+            if now - self._last_sent.get(key, -timeout) < timeout:
+                return True
+            self._last_sent[key] = now
+            return False
+
+    def emit(self, record):
+        if self.is_throttled(record):
+            return
+        try:
+            if mail := getattr(record, "ynh_admin_mail", None):
+                subject, message, html_message = mail
+                self.send_mail(subject, message, fail_silently=True, html_message=html_message)
+            else:
+                super().emit(record)
+        except Exception:  # noqa: BLE001
+            # An exception would stop the QueueListener thread:
+            self.handleError(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, e.g. for log processors like Loki or Vector.
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(data, default=str)
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Import the ASGI application in a new interpreter with "-X importtime"'
+        " and list the slowest imports of the service startup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module",
+            default="umap_ynh.asgi",
+            help="Module to import (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=("cumulative", "self"),
+            default="cumulative",
+            help="Sort by the time of the import with (cumulative) or without (self) its sub imports",
+        )
+        parser.add_argument("--limit", type=int, default=30, help="Number of imports to list (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {options['module']}"],
+            env=os.environ,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            errors = "\n".join(line for line in process.stderr.splitlines() if not line.startswith("import time:"))
+            raise CommandError(f"Import of {options['module']} failed:\n{errors}")
+
+        imports = []
+        for line in process.stderr.splitlines():
+            # e.g.: "import time:       142 |        837 |   django.core.asgi"
+            if not line.startswith("import time:"):
+                continue
+            self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+            if not self_us.strip().isdigit():
+                continue  # The header line
+            imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+        if not imports:
+            raise CommandError(f"No import times found in:\n{process.stderr}")
+
+        sort_index = 0 if options["sort"] == "self" else 1
+        imports.sort(key=lambda item: item[sort_index], reverse=True)
+
+        self.stdout.write(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+        for self_us, cumulative_us, name in imports[: options["limit"]]:
+            self.stdout.write(f"{self_us / 1000:10.1f} {cumulative_us / 1000:16.1f}  {name}")
+
+        total_us = sum(item[0] for item in imports)
+        self.stdout.write(self.style.SUCCESS(f"{len(imports)} modules imported in {total_us / 1000:.1f} ms"))
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from umap_ynh.compression import precompress
+
+
+class Command(BaseCommand):
+    help = "Write missing or outdated pre-compressed copies (.gz) of all datalayer files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Compress all files, even if the compressed copies are up-to-date",
+        )
+
+    def handle(self, *args, **options):
+        root = Path(settings.MEDIA_ROOT) / "datalayer"
+        if not root.is_dir():
+            self.stdout.write(f"No datalayers in {root}")
+            return
+
+        total = written = 0
+        for path in root.rglob("*.geojson"):
+            total += 1
+            if precompress(path, force=options["force"]):
+                written += 1
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"Compressed {path}")
+        self.stdout.write(self.style.SUCCESS(f"Compressed {written} of {total} datalayer files."))
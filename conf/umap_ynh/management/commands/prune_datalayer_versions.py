@@ -0,0 +1,54 @@
+import sys
+
+from django.conf import settings
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from umap_ynh.storage import YunohostDataStorage
+from umap_ynh.versions import get_rules, prune_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the datalayer versions not kept by the retention rules (YNH_VERSIONS_RETENTION)"
+        " and report the reclaimed space. e.g.: umap prune_datalayer_versions --dry-run --keep-daily 30"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-last", type=int, help="Number of newest versions to keep")
+        parser.add_argument("--keep-daily", type=int, help="Number of days to keep the newest version of")
+        parser.add_argument("--keep-weekly", type=int, help="Number of weeks to keep the newest version of")
+        parser.add_argument(
+            "--delete-orphans",
+            action="store_true",
+            help="Delete also the versions of datalayers that are not in the database (older than one day)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Pretend to delete but just report",
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(storages["data"], YunohostDataStorage):
+            sys.exit("This command is only available for the filesystem storage of this package.")
+        if not settings.YNH_VERSIONS_RETENTION and options["keep_last"] is None:
+            sys.exit("YNH_VERSIONS_RETENTION is disabled, use --keep-last (and --keep-daily/--keep-weekly).")
+
+        rules = get_rules(last=options["keep_last"], daily=options["keep_daily"], weekly=options["keep_weekly"])
+        self.stdout.write(f"Retention rules: {rules}")
+        stats = prune_all(
+            rules=rules,
+            delete_orphans=options["delete_orphans"],
+            dry_run=options["dry_run"],
+            report=self.stdout.write if options["verbosity"] > 1 else None,
+        )
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {stats['deleted']} of {stats['files']} files in {stats['directories']} directories,"
+                f" reclaimed {filesizeformat(stats['reclaimed'])}."
+            )
+        )
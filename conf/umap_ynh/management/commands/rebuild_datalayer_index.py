@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from umap_ynh import datalayer_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the index of the current datalayer versions of public maps,"
+        " that nginx uses to answer conditional requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only list the outdated entries (e.g. of maps that are not public anymore), fail if there are any.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            paths = datalayer_index.find_outdated()
+            for path in paths:
+                self.stdout.write(str(path))
+            if paths:
+                raise CommandError(f"{len(paths)} outdated entries in {settings.YNH_DATALAYER_INDEX_DIR}.")
+            self.stdout.write(self.style.SUCCESS("The datalayer index is up to date."))
+            return
+
+        count = datalayer_index.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {count} datalayers in {settings.YNH_DATALAYER_INDEX_DIR}.")
+        )
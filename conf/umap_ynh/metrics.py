@@ -0,0 +1,171 @@
+"""
+Request metrics (latency, DB queries, response size) per view, shared by all uvicorn workers via Redis
+and exported in the Prometheus text format. Enabled with the "metrics" setting in the config panel.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets:
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+KEY_PREFIX = "ynh_metrics"
+SERIES_KEY = f"{KEY_PREFIX}:series"
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        # Short timeouts: A slow Redis should not slow down the requests.
+        _client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _client
+
+
+class QueryRecorder:
+    """
+    Database "execute_wrapper" that counts the queries and sums up their duration.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def get_response_size(response):
+    if response.streaming:
+        # e.g.: FileResponse, the size is only known if it's set by the view:
+        return int(response.get("Content-Length", 0))
+    return len(response.content)
+
+
+def get_view_name(request):
+    if match := getattr(request, "resolver_match", None):
+        return match.view_name
+    return "<unresolved>"
+
+
+def record(*, view, method, status, duration, queries, query_duration, size):
+    key = f"{KEY_PREFIX}:{view}|{method}"
+    bucket = next((f"{bound}" for bound in LATENCY_BUCKETS if duration <= bound), "+Inf")
+    with get_client().pipeline(transaction=False) as pipe:
+        pipe.sadd(SERIES_KEY, key)
+        pipe.hincrby(key, "count", 1)
+        pipe.hincrbyfloat(key, "duration", duration)
+        pipe.hincrby(key, f"bucket:{bucket}", 1)
+        pipe.hincrby(key, f"status:{status}", 1)
+        pipe.hincrby(key, "queries", queries)
+        pipe.hincrbyfloat(key, "query_duration", query_duration)
+        pipe.hincrby(key, "size", size)
+        pipe.execute()
+
+
+class MetricsMiddleware:
+    """
+    Record latency, DB queries and response size of every request.
+    Should be the first middleware, so that the time of all others is included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        try:
+            record(
+                view=get_view_name(request),
+                method=request.method,
+                status=response.status_code,
+                duration=duration,
+                queries=recorder.count,
+                query_duration=recorder.duration,
+                size=get_response_size(response),
+            )
+        except redis.RedisError:
+            logger.warning("Can't record request metrics", exc_info=True)
+        return response
+
+
+def format_labels(**labels):
+    # Escape label values, see: https://prometheus.io/docs/instrumenting/exposition_formats/
+    values = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return ",".join(f'{name}="{value}"' for name, value in zip(labels, values))
+
+
+def render_metrics():
+    client = get_client()
+    keys = sorted(key.decode() for key in client.smembers(SERIES_KEY))
+    with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        all_values = pipe.execute()
+
+    families = {
+        "umap_http_request_duration_seconds": ("histogram", "Latency of the requests", []),
+        "umap_http_responses_total": ("counter", "Number of responses per status code", []),
+        "umap_db_queries_total": ("counter", "Number of database queries", []),
+        "umap_db_query_duration_seconds_total": ("counter", "Duration of the database queries", []),
+        "umap_http_response_size_bytes_total": ("counter", "Size of the response bodies", []),
+    }
+    for key, values in zip(keys, all_values):
+        values = {field.decode(): value.decode() for field, value in values.items()}
+        view, method = key.removeprefix(f"{KEY_PREFIX}:").rsplit("|", 1)
+        labels = format_labels(view=view, method=method)
+
+        lines = families["umap_http_request_duration_seconds"][2]
+        cumulative = 0
+        for bound in (*(f"{bound}" for bound in LATENCY_BUCKETS), "+Inf"):
+            cumulative += int(values.get(f"bucket:{bound}", 0))
+            lines.append(f'umap_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"umap_http_request_duration_seconds_sum{{{labels}}} {values.get('duration', 0)}")
+        lines.append(f"umap_http_request_duration_seconds_count{{{labels}}} {values.get('count', 0)}")
+
+        for field, value in values.items():
+            if field.startswith("status:"):
+                status_labels = format_labels(view=view, method=method, status=field.removeprefix("status:"))
+                families["umap_http_responses_total"][2].append(f"umap_http_responses_total{{{status_labels}}} {value}")
+        for name, field in (
+            ("umap_db_queries_total", "queries"),
+            ("umap_db_query_duration_seconds_total", "query_duration"),
+            ("umap_http_response_size_bytes_total", "size"),
+        ):
+            families[name][2].append(f"{name}{{{labels}}} {values.get(field, 0)}")
+
+    output = []
+    for name, (metric_type, help_text, lines) in families.items():
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
+
+
+def metrics_view(request):
+    """
+    Prometheus text endpoint, only for requests from the host itself to uvicorn.
+    nginx denies the URL (see nginx.conf), the client address is only checked as second line:
+    Requests via the Unix domain socket of uvicorn have no REMOTE_ADDR.
+    """
+    if request.META.get("REMOTE_ADDR", "") not in ("", "127.0.0.1", "::1") or "HTTP_X_FORWARDED_FOR" in request.META:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
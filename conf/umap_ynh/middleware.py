@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+
+class XAccelRedirectPrefixMiddleware(MiddlewareMixin):
+    """
+    uMap sends "X-Accel-Redirect" paths without the URL prefix of the app,
+    e.g.: "/proxy/..." and "/internal/..."
+    But the nginx locations of this package are below the app path,
+    e.g.: "/umap/proxy/..." and "/umap/internal/..."
+    So add the prefix, if the app is not installed into the domain root.
+    """
+
+    def process_response(self, request, response):
+        header = settings.UMAP_XSENDFILE_HEADER
+        if location := response.get(header):
+            prefix = settings.FORCE_SCRIPT_NAME.rstrip("/")
+            if prefix and not location.startswith(f"{prefix}/"):
+                response[header] = f"{prefix}{location}"
+        return response
@@ -0,0 +1,127 @@
+"""
+Caching proxy for the Overpass importer of uMap (settings.UMAP_IMPORTERS):
+
+This view only checks the request, the Overpass server is requested by nginx via "X-Accel-Redirect"
+(see "overpass-upstream" location in nginx.conf): The results are cached by nginx, keyed by the normalized query,
+identical queries of all workers are send only once to the Overpass server and no worker waits for it.
+
+Only logged-in users and requests from a map page the user can view (remote data layers of the importer)
+can use it. The requests are limited per client IP by settings.YNH_OVERPASS_RATE_LIMIT.
+"""
+
+import logging
+import re
+import time
+from urllib.parse import urlencode, urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseRedirect
+from django.urls import get_script_prefix, reverse
+from django.views.decorators.http import require_GET
+from umap.models import Map
+from umap.views import ajax_proxy
+
+
+logger = logging.getLogger(__name__)
+
+# The URL encoded query is send to nginx in the "X-Accel-Redirect" header, see "proxy_buffer_size" in nginx.conf:
+MAX_QUERY_LENGTH = 12_000
+
+# The bounding box of the importer, e.g.: "(48.8566,2.3522,48.8666,2.3622)"
+BBOX_RE = re.compile(r"\(\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\)")
+# Decimal places of the bounding box coordinates in the cache key (~11m):
+BBOX_PRECISION = 4
+
+# Path of uMap's "map" view, e.g.: "/fr/map/my-map_123", and of "map_new":
+MAP_PATH_RE = re.compile(r"^(?:[a-z]{2,3}(?:-[a-z0-9]+)?/)?map/(?:[-_\w]+_(?P<map_id>\d+)|new/)$")
+
+
+def round_bbox(match):
+    return "(" + ",".join(f"{float(value):.{BBOX_PRECISION}f}" for value in match.groups()) + ")"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Queries of the same area differ only in the last digits of the map view, e.g.:
+    "[out:json];nwr[amenity=cafe](48.856612,2.352219,48.866613,2.362220);out geom;"
+    The normalized query is send to the Overpass server, so the result always matches the cache key.
+    """
+    query = " ".join(query.split())
+    return BBOX_RE.sub(round_bbox, query)
+
+
+def is_allowed(request) -> bool:
+    """
+    Logged-in users, or the "Referer" is a map the user can view, e.g.: a remote data layer of a public map.
+    Anonymous users can use the importer on a new map, if they can create maps.
+    """
+    if request.user.is_authenticated:
+        return True
+
+    referer = urlparse(request.headers.get("Referer", ""))
+    script_prefix = get_script_prefix()
+    if referer.netloc != request.get_host() or not referer.path.startswith(script_prefix):
+        return False
+    match = MAP_PATH_RE.match(referer.path[len(script_prefix) :])
+    if not match:
+        return False
+    if not match["map_id"]:
+        return settings.UMAP_ALLOW_ANONYMOUS
+    map_inst = Map.objects.filter(pk=match["map_id"]).first()
+    return map_inst is not None and map_inst.can_view(request)
+
+
+def is_rate_limited(request) -> bool:
+    """
+    Count the requests per client IP in fixed periods, shared by all workers via the cache.
+    """
+    limit, period = settings.YNH_OVERPASS_RATE_LIMIT
+    key = f"ynh_overpass:{request.META.get('REMOTE_ADDR', '')}:{int(time.time() // period)}"
+    try:
+        cache.add(key, 0, timeout=period)
+        return cache.incr(key) > limit
+    except Exception:
+        # Without cache, the Overpass server has to limit the requests:
+        logger.exception("Can't check the Overpass rate limit")
+        return False
+
+
+@require_GET
+def overpass_view(request):
+    query = request.GET.get("data", "")
+    upstream_args = urlencode({"data": normalize_query(query)})
+    if not query or len(upstream_args) > MAX_QUERY_LENGTH:
+        return HttpResponseBadRequest("Missing or too long query")
+
+    if not is_allowed(request):
+        return HttpResponseForbidden("Only for logged-in users or the maps of this site")
+
+    if is_rate_limited(request):
+        response = HttpResponse("Too many Overpass requests", status=429, content_type="text/plain")
+        response["Retry-After"] = settings.YNH_OVERPASS_RATE_LIMIT[1]
+        return response
+
+    # The prefix of the app path is added by XAccelRedirectPrefixMiddleware:
+    response = HttpResponse()
+    response[settings.UMAP_XSENDFILE_HEADER] = f"/overpass-upstream/?{upstream_args}"
+    response["X-Overpass-Url"] = settings.YNH_OVERPASS_URL
+    return response
+
+
+def is_overpass_url(url: str) -> bool:
+    parsed = urlparse(url)
+    site = urlparse(settings.SITE_URL)
+    return (parsed.scheme, parsed.netloc, parsed.path) == (site.scheme, site.netloc, reverse("ynh_overpass"))
+
+
+@require_GET
+def ajax_proxy_view(request):
+    """
+    uMap's "ajax-proxy", but the remote data layers of the Overpass importer are redirected to overpass_view():
+    uMap's proxy refuses URLs of the own host.
+    Not wrapped in cache_page() like uMap's view: The responses are cached by nginx (see "proxy" location).
+    """
+    if is_overpass_url(request.GET.get("url", "")):
+        return HttpResponseRedirect(request.GET["url"])
+    return ajax_proxy(request)
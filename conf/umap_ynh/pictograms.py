@@ -0,0 +1,211 @@
+"""
+Pictograms of settings.UMAP_PICTOGRAMS_COLLECTIONS, collected by "collectstatic" via PictogramFinder:
+
+The SVG files are minified into STATIC_ROOT/pictograms/ and listed in one JSON catalog, that is served
+instead of the directory walk of uMap's "pictogram/json/" view.
+
+The URLs of the pictograms are stored in the maps of the users, so the catalog lists the stable names.
+The hashed copies of the static files storage are only added next to them. No sprite: uMap renders
+every pictogram as "<img src>" of its own URL.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from functools import lru_cache
+from pathlib import Path
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import BaseFinder
+from django.contrib.staticfiles.utils import matches_patterns
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import etag, require_GET
+from umap.views import PictogramJSONList
+
+
+logger = logging.getLogger(__name__)
+
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+XLINK_NAMESPACE = "http://www.w3.org/1999/xlink"
+# Namespaces of editors like Inkscape, not needed to display the pictogram:
+EDITOR_NAMESPACES = (
+    "http://www.inkscape.org/namespaces/inkscape",
+    "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
+    "http://purl.org/dc/elements/1.1/",
+    "http://creativecommons.org/ns#",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+)
+REMOVED_TAGS = {f"{{{SVG_NAMESPACE}}}metadata", f"{{{SVG_NAMESPACE}}}title", f"{{{SVG_NAMESPACE}}}desc"}
+
+CATALOG_PATH = "pictograms/catalog.json"
+
+ElementTree.register_namespace("", SVG_NAMESPACE)
+ElementTree.register_namespace("xlink", XLINK_NAMESPACE)
+
+
+def is_editor_name(name: str) -> bool:
+    return name.startswith("{") and name[1:].startswith(EDITOR_NAMESPACES)
+
+
+def minify_svg(content: bytes) -> bytes:
+    """
+    Remove the XML declaration, comments, metadata and editor specific elements/attributes
+    and the whitespace between the elements.
+    """
+    root = ElementTree.fromstring(content)
+    for parent in root.iter():
+        for child in list(parent):
+            if not isinstance(child.tag, str) or child.tag in REMOVED_TAGS or is_editor_name(child.tag):
+                parent.remove(child)
+        for name in list(parent.attrib):
+            if is_editor_name(name):
+                del parent.attrib[name]
+        if parent.text and not parent.text.strip():
+            parent.text = None
+        if parent.tail and not parent.tail.strip():
+            parent.tail = None
+    minified = ElementTree.tostring(root, encoding="unicode", short_empty_elements=True)
+    return re.sub(r"\s+", " ", minified).encode()
+
+
+class PictogramStorage(FileSystemStorage):
+    """
+    The files of one pictogram collection, SVG files are minified on read.
+    """
+
+    def _open(self, name, mode="rb"):
+        f = super()._open(name, mode)
+        if not name.endswith(".svg"):
+            return f
+        with f:
+            return ContentFile(minify_svg(f.read()), name=name)
+
+
+class CatalogStorage(FileSystemStorage):
+    """
+    The catalog of all pictograms, that exists only in STATIC_ROOT after "collectstatic".
+    """
+
+    def __init__(self, catalog):
+        super().__init__(location=settings.STATIC_ROOT)
+        self.catalog = catalog
+
+    def _open(self, name, mode="rb"):
+        return ContentFile(json.dumps(self.catalog, separators=(",", ":")).encode(), name=name)
+
+    def get_modified_time(self, name):
+        # Always copied by "collectstatic", the catalog is small:
+        raise NotImplementedError
+
+
+class PictogramFinder(BaseFinder):
+    """
+    Staticfiles finder for the minified pictograms of all collections with an absolute path
+    and the catalog in the format of uMap's "pictogram/json/" view, with size and hash of every pictogram.
+    "collectstatic" stores them with their stable names and hashed copies and pre-compresses them,
+    see YunohostStaticFilesStorage.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.storages = {}
+        for name, definition in settings.UMAP_PICTOGRAMS_COLLECTIONS.items():
+            root = Path(definition["path"])
+            if not root.is_absolute():
+                # Part of the static files, see umap.utils.collect_pictograms()
+                logger.debug("Skip pictogram collection %r with relative path %s", name, root)
+                continue
+            self.storages[name] = PictogramStorage(location=root)
+
+    def iter_pictograms(self, storage, ignore_patterns):
+        categories, _ = storage.listdir("pictograms")
+        for category in sorted(categories):
+            _, files = storage.listdir(f"pictograms/{category}")
+            for file_name in sorted(files):
+                if not file_name.startswith(".") and not matches_patterns(file_name, ignore_patterns):
+                    yield category, f"pictograms/{category}/{file_name}"
+
+    def build_catalog(self, ignore_patterns) -> dict:
+        catalog = {}
+        for name, storage in self.storages.items():
+            categories = {}
+            for category, path in self.iter_pictograms(storage, ignore_patterns):
+                with storage.open(path) as f:
+                    content = f.read()
+                categories.setdefault(category, []).append(
+                    {
+                        "name": Path(path).stem,
+                        "src": f"{settings.STATIC_URL}{path}",
+                        "size": len(content),
+                        "hash": hashlib.sha256(content).hexdigest()[:16],
+                    }
+                )
+            catalog[name] = {
+                "attribution": settings.UMAP_PICTOGRAMS_COLLECTIONS[name].get("attribution"),
+                "categories": categories,
+            }
+        return catalog
+
+    def list(self, ignore_patterns):
+        for storage in self.storages.values():
+            for _, path in self.iter_pictograms(storage, ignore_patterns):
+                yield path, storage
+        if self.storages:
+            yield CATALOG_PATH, CatalogStorage(self.build_catalog(ignore_patterns))
+
+    def find(self, path, find_all=False, **kwargs):
+        # "all" is the name of the argument before Django 5.2:
+        find_all = kwargs.get("all", find_all)
+        matches = []
+        for storage in self.storages.values():
+            if path.startswith("pictograms/") and storage.exists(path):
+                matches.append(storage.path(path))
+                if not find_all:
+                    return matches[0]
+        return matches if find_all else []
+
+
+def get_catalog_path(static_root: Path) -> Path:
+    return static_root / CATALOG_PATH
+
+
+@lru_cache
+def load_catalog(path: Path, mtime_ns: int) -> tuple[bytes, str]:
+    content = path.read_bytes()
+    return content, hashlib.sha256(content).hexdigest()[:16]
+
+
+def get_catalog():
+    """
+    Returns the content and hash of the catalog, or None, if it's not build.
+    """
+    path = get_catalog_path(Path(settings.STATIC_ROOT))
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return load_catalog(path, mtime_ns)
+
+
+def get_catalog_etag(request):
+    if catalog := get_catalog():
+        return catalog[1]
+    return None
+
+
+@require_GET
+@etag(get_catalog_etag)
+def pictogram_list_view(request):
+    if not (catalog := get_catalog()):
+        logger.warning('Pictogram catalog missing, run "umap collectstatic"')
+        return PictogramJSONList.as_view()(request)
+
+    response = HttpResponse(catalog[0], content_type="application/json")
+    # Changed only by upgrades, a new ETag is requested after one hour:
+    patch_cache_control(response, public=True, max_age=60 * 60)
+    return response
@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import logging
+import time
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation
+from django_yunohost_integration.sso_auth.auth_middleware import SSOwatRemoteUserMiddleware
+from django_yunohost_integration.yunohost.ynh_jwt import verify_sso_jwt
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachedSSOwatRemoteUserMiddleware(SSOwatRemoteUserMiddleware):
+    """
+    Cache the user looked up by SSOwatRemoteUserMiddleware for a short time (settings.YNH_SSO_CACHE_TIMEOUT),
+    but not longer than the SSOwat JWT is valid.
+
+    The cache key is a hash of the session key, the SSOwat JWT cookie, the basic auth header and the user header.
+    Any change of them (e.g.: new SSO login, logout) is a cache miss. Only the user query is skipped:
+    The JWT and the basic auth username are verified on every request.
+    """
+
+    def get_cache_key(self, request):
+        session_key = request.session.session_key
+        credentials = (
+            session_key,
+            request.COOKIES.get(settings.YNH_JWT_COOKIE_NAME),
+            request.META.get(settings.YNH_BASIC_AUTH_HEADER_KEY),
+            request.META.get(self.header),
+        )
+        if not all(credentials):
+            return None
+        digest = hashlib.sha256("\0".join(credentials).encode()).hexdigest()
+        return f"ynh_sso_user:{digest}"
+
+    def get_cache_timeout(self, request):
+        timeout = settings.YNH_SSO_CACHE_TIMEOUT
+        data = jwt.decode(request.COOKIES[settings.YNH_JWT_COOKIE_NAME], options={"verify_signature": False})
+        if exp := data.get("exp"):
+            timeout = min(timeout, int(exp - time.time()))
+        return timeout
+
+    def verify_credentials(self, request, user):
+        # The same checks as SSOwatRemoteUserMiddleware.process_request() after the user lookup:
+        verify_sso_jwt(sso_jwt_data=request.COOKIES[settings.YNH_JWT_COOKIE_NAME], user=user)
+        scheme, creds = request.META[settings.YNH_BASIC_AUTH_HEADER_KEY].split(" ", 1)
+        if scheme.lower() != "basic":
+            raise SuspiciousOperation("Header scheme not supported")
+        username = str(base64.b64decode(creds), encoding="utf-8").split(":", 1)[0]
+        if username != user.username:
+            raise SuspiciousOperation("Wrong username")
+
+    def process_request(self, request):
+        if cache_key := self.get_cache_key(request):
+            user = cache.get(cache_key)
+            if user is not None:
+                logger.debug("Use cached SSO user %s", user)
+                self.verify_credentials(request, user)
+                request.user = user
+                return
+
+        super().process_request(request)
+
+        # After a login, the session key has changed:
+        if request.user.is_authenticated and (cache_key := self.get_cache_key(request)):
+            timeout = self.get_cache_timeout(request)
+            if timeout > 0:
+                cache.set(cache_key, request.user, timeout=timeout)
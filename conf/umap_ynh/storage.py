@@ -0,0 +1,94 @@
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from umap.storage.fs import FSDataStorage
+from umap.storage.staticfiles import UmapManifestStaticFilesStorage
+
+from umap_ynh.compression import precompress
+
+
+logger = logging.getLogger(__name__)
+
+
+class YunohostDataStorage(FSDataStorage):
+    """
+    Write the pre-compressed copies of a datalayer on save, so that nginx can
+    serve them via "gzip_static" without compressing them on every request.
+    Apply the retention rules of settings.YNH_VERSIONS_RETENTION to the versions.
+
+    uMap's "purge_old_versions" command refuses to run with this storage (it checks for FSDataStorage),
+    use the "prune_datalayer_versions" command instead.
+    """
+
+    def onDatalayerSave(self, instance):
+        if settings.YNH_VERSIONS_RETENTION:
+            # FSDataStorage.onDatalayerSave(), with the retention rules instead of
+            # "keep the last settings.UMAP_KEEP_VERSIONS versions":
+            self.purge_gzip(instance)
+            # Not imported at module level: umap.models imports this module.
+            from umap_ynh import versions
+
+            versions.prune_datalayer(self, instance)
+        else:
+            super().onDatalayerSave(instance)
+
+        if not instance.geojson:
+            return
+        path = Path(instance.geojson.path)
+        try:
+            precompress(path)
+        except OSError:
+            # The uncompressed file is saved and can be served, so don't fail:
+            logger.exception("Can't compress %s", path)
+
+        from umap_ynh import datalayer_index
+
+        try:
+            datalayer_index.update_datalayer(instance)
+        except OSError:
+            # Without an index entry, the requests are checked by uMap:
+            logger.exception("Can't update the datalayer index of %s", instance.pk)
+
+    def onDatalayerDelete(self, instance):
+        from umap_ynh import datalayer_index
+
+        datalayer_index.remove_datalayer(instance)
+        super().onDatalayerDelete(instance)
+
+
+class YunohostStaticFilesStorage(UmapManifestStaticFilesStorage):
+    """
+    Write pre-compressed copies of the collected (and hashed) static files,
+    so that nginx serves them via "gzip_static" without compressing them on every request.
+    Only the files of this collectstatic run are compressed, not the rest of STATIC_ROOT.
+    """
+
+    compress_suffixes = (".css", ".js", ".mjs", ".json", ".map", ".svg", ".txt", ".html", ".xml", ".ico", ".webmanifest")
+    # Smaller files are not worth it:
+    compress_min_size = 256
+
+    def post_process(self, paths, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, **options):
+            if not isinstance(processed, Exception):
+                names.add(name)
+                if hashed_name:
+                    names.add(hashed_name)
+            yield name, hashed_name, processed
+        if options.get("dry_run"):
+            return
+
+        # Written by ManifestFilesMixin.post_process() after all files:
+        names.add(self.manifest_name)
+        total = written = 0
+        for name in sorted(names):
+            path = Path(self.path(name))
+            if path.suffix not in self.compress_suffixes or not path.is_file():
+                continue
+            if path.stat().st_size < self.compress_min_size:
+                continue
+            total += 1
+            if precompress(path):
+                written += 1
+        logger.info("Compressed %i of %i static files", written, total)
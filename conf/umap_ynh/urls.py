@@ -0,0 +1,33 @@
+"""
+URLs of the YunoHost integration, in front of all uMap URLs (settings.ROOT_URLCONF).
+"""
+from django.conf import settings
+from django.conf.urls.i18n import i18n_patterns
+from django.urls import path, re_path
+from umap.urls import urlpatterns as umap_urlpatterns
+
+from umap_ynh.datalayer_index import datalayer_view
+from umap_ynh.overpass import ajax_proxy_view, overpass_view
+from umap_ynh.pictograms import pictogram_list_view
+
+
+urlpatterns = [
+    path("overpass/interpreter", overpass_view, name="ynh_overpass"),
+    # "ajax-proxy", that redirects the remote data layers of the Overpass importer to "ynh_overpass":
+    re_path(r"^ajax-proxy/$", ajax_proxy_view, name="ynh_ajax_proxy"),
+]
+
+# Same URLs as uMap's views, see the comments:
+urlpatterns += i18n_patterns(
+    # "pictogram_list_json", but from the catalog build by "umap collectstatic":
+    path("pictogram/json/", pictogram_list_view, name="ynh_pictogram_list_json"),
+    # "datalayer_view", with ETag and Last-Modified of the datalayer version:
+    path("datalayer/<int:map_id>/<uuid:pk>/", datalayer_view, name="ynh_datalayer_view"),
+)
+
+if settings.YNH_METRICS_ENABLED:
+    from umap_ynh.metrics import metrics_view
+
+    urlpatterns.append(path("metrics", metrics_view, name="ynh_metrics"))
+
+urlpatterns += umap_urlpatterns
@@ -0,0 +1,167 @@
+"""
+Retention rules for the datalayer versions of the filesystem data storage (settings.YNH_VERSIONS_RETENTION):
+
+Every save of a datalayer writes a new file "<datalayer id>_<save time in ms>.geojson" into MEDIA_ROOT. Kept are:
+
+* "last": the newest versions
+* "daily": the newest version of each of the last days with versions
+* "weekly": the newest version of each of the last (ISO) weeks with versions
+
+and always the current version of the datalayer. The rules are applied to the saved datalayer on every save
+(see YunohostDataStorage) and to all datalayers by the "prune_datalayer_versions" management command.
+"""
+
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from umap.models import DataLayer
+
+
+VERSION_RE = re.compile(r"^(?P<prefix>[^_]+)_(?P<ref>\d+)\.geojson$")
+COMPRESSED_SUFFIXES = (".gz",)
+# Versions of unknown datalayers may be written right now by a new datalayer:
+ORPHAN_MIN_AGE = 24 * 60 * 60
+
+
+def get_rules(*, last=None, daily=None, weekly=None) -> dict:
+    rules = {"last": 0, "daily": 0, "weekly": 0, **(settings.YNH_VERSIONS_RETENTION or {})}
+    for name, value in (("last", last), ("daily", daily), ("weekly", weekly)):
+        if value is not None:
+            rules[name] = value
+    return rules
+
+
+def get_day(ref: int):
+    return datetime.fromtimestamp(ref / 1000, tz=timezone.utc).date()
+
+
+def get_week(ref: int):
+    return datetime.fromtimestamp(ref / 1000, tz=timezone.utc).isocalendar()[:2]
+
+
+def select_kept(refs, *, last=0, daily=0, weekly=0) -> set[int]:
+    """
+    Returns the versions (save times in ms) to keep by the retention rules.
+    """
+    refs = sorted(refs, reverse=True)
+    # The newest version is always kept: It may be saved right now and not yet be the current one.
+    kept = set(refs[: max(last, 1)])
+    for count, get_period in ((daily, get_day), (weekly, get_week)):
+        periods = set()
+        for ref in refs:
+            if len(periods) >= count:
+                break
+            period = get_period(ref)
+            if period not in periods:
+                # The refs are sorted, so it's the newest version of the period:
+                periods.add(period)
+                kept.add(ref)
+    return kept
+
+
+def select_deleted(names, *, rules, current_names, known_prefixes, delete_orphans=False) -> list[str]:
+    """
+    Returns the file names of one datalayer directory to delete: The versions not kept by the rules
+    and the compressed copies (.gz) of deleted or missing versions.
+    """
+    names = set(names)
+    groups = defaultdict(dict)
+    for name in names:
+        if match := VERSION_RE.match(name):
+            groups[match["prefix"]][int(match["ref"])] = name
+
+    deleted = set()
+    min_orphan_ref = (time.time() - ORPHAN_MIN_AGE) * 1000
+    for prefix, versions in groups.items():
+        if prefix not in known_prefixes:
+            # e.g.: Datalayers of deleted maps, the database cascade doesn't delete their files.
+            if delete_orphans:
+                deleted.update(name for ref, name in versions.items() if ref < min_orphan_ref)
+            continue
+        kept = select_kept(versions, **rules)
+        deleted.update(name for ref, name in versions.items() if ref not in kept and name not in current_names)
+
+    for name in names:
+        if name.endswith(COMPRESSED_SUFFIXES):
+            original = name.rsplit(".", 1)[0]
+            if VERSION_RE.match(original) and (original in deleted or original not in names):
+                deleted.add(name)
+    return sorted(deleted)
+
+
+def delete_files(path: Path, names, *, dry_run=False) -> tuple[int, int]:
+    """
+    Returns the number of deleted files and their size in bytes.
+    """
+    count = size = 0
+    for name in names:
+        file_path = path / name
+        try:
+            file_size = file_path.stat().st_size
+            if not dry_run:
+                file_path.unlink()
+        except FileNotFoundError:
+            continue
+        count += 1
+        size += file_size
+    return count, size
+
+
+def prune_datalayer(storage, instance) -> int:
+    """
+    Apply the rules to the versions of one datalayer, called on save instead of uMap's
+    "keep the last settings.UMAP_KEEP_VERSIONS versions".
+    """
+    prefixes = {str(instance.pk)}
+    if instance.old_id:
+        prefixes.add(str(instance.old_id))
+    names = [name for name in storage._get_names(instance) if name.split("_", 1)[0] in prefixes]
+    deleted = select_deleted(
+        names,
+        rules=get_rules(),
+        current_names={Path(instance.geojson.name).name},
+        known_prefixes=prefixes,
+    )
+    count, _ = delete_files(Path(storage.path(storage._base_path(instance))), deleted)
+    return count
+
+
+def prune_all(*, rules, delete_orphans=False, dry_run=False, report=None) -> dict:
+    """
+    Apply the rules to all datalayer directories in MEDIA_ROOT, in one pass over the file system.
+    "report" is called with a message for every directory with deleted files.
+    """
+    current_names = set()
+    known_prefixes = set()
+    for pk, old_id, geojson in DataLayer.objects.values_list("pk", "old_id", "geojson").iterator():
+        known_prefixes.add(str(pk))
+        if old_id:
+            known_prefixes.add(str(old_id))
+        if geojson:
+            current_names.add(Path(geojson).name)
+
+    stats = {"directories": 0, "files": 0, "deleted": 0, "reclaimed": 0}
+    root = Path(settings.MEDIA_ROOT) / "datalayer"
+    for dirpath, _, filenames in os.walk(root):
+        if not filenames:
+            continue
+        stats["directories"] += 1
+        stats["files"] += len(filenames)
+        deleted = select_deleted(
+            filenames,
+            rules=rules,
+            current_names=current_names,
+            known_prefixes=known_prefixes,
+            delete_orphans=delete_orphans,
+        )
+        count, size = delete_files(Path(dirpath), deleted, dry_run=dry_run)
+        stats["deleted"] += count
+        stats["reclaimed"] += size
+        if report and count:
+            report(f"{dirpath}: {count} of {len(filenames)} files, {size} bytes")
+    return stats
@@ -18,6 +18,29 @@ XDG_CACHE_HOME="$data_dir/.cache/"
 log_path=/var/log/$app
 log_file="${log_path}/${app}.log"
 
+# Memory budget for all uvicorn worker processes, keep in sync with "ram.runtime" in manifest.toml
+RAM_RUNTIME_MB=1024
+# Estimated resident memory of one uvicorn worker (Django + GeoDjango + uMap):
+WORKER_RAM_MB=256
+# Maximum number of PostgreSQL connections of all workers together (YNH_DB_MAX_CONNECTIONS in settings.py).
+# Each worker gets at least two of them, so there are at most $db_max_connections / 2 workers.
+db_max_connections=20
+
+# The app virtualenv. Upgrades with upgrade_mode "swap" build a new one next to it, see: myynh_new_release()
+venv_dir="$data_dir/.venv"
+# The collected static files (settings.STATIC_ROOT), the same for upgrades with upgrade_mode "swap"
+static_dir="$install_dir/static"
+# Directory of "umap_ynh/" and "settings.py", the same for upgrades with upgrade_mode "swap"
+code_dir="$data_dir"
+
+# Downloaded Python archives, one directory per app instance (see "--cache-dir" of setup_python.py):
+PY_ARCHIVE_CACHE_DIR=/var/cache/umap_ynh/python/$app
+# Source tree, ccache objects and PGO profile of the last Python build (see "--cache-dir" of install_python.py):
+PY_BUILD_CACHE_DIR=/var/cache/umap_ynh/python-build
+# Wheels and lock files of the app requirements per Python ABI, one directory per app instance:
+# Never shared, because every instance builds them as its own app user.
+PY_WHEELHOUSE_DIR=/var/cache/umap_ynh/wheels/$app
+
 #=================================================
 # HELPERS
 #=================================================
@@ -35,8 +58,9 @@ myynh_install_python() {
     #
     ynh_print_info "Install latest Python v${PY_REQUIRED_MAJOR}..."
 
-    ynh_hide_warnings python3 "$data_dir/install_python.py" -vv ${PY_REQUIRED_MAJOR}
-	py_app_version=$(python3 "$data_dir/install_python.py" ${PY_REQUIRED_MAJOR})
+    # Patch releases reuse the objects and the PGO profile of the last build:
+    ynh_hide_warnings python3 "$data_dir/install_python.py" -vv --cache-dir "$PY_BUILD_CACHE_DIR" --reuse-pgo-profile ${PY_REQUIRED_MAJOR}
+	py_app_version=$(python3 "$data_dir/install_python.py" --cache-dir "$PY_BUILD_CACHE_DIR" ${PY_REQUIRED_MAJOR})
 
 	# Print some version information:
 	ynh_print_info "Python version: $($py_app_version -VV)"
@@ -50,8 +74,19 @@ myynh_setup_python() {
     #
     ynh_print_info "Setup latest Python v${PY_REQUIRED_MAJOR}..."
 
-    ynh_hide_warnings ynh_exec_as_app python3 "$data_dir/setup_python.py" -vv ${PY_REQUIRED_MAJOR}
-	py_app_version=$(ynh_exec_as_app python3 "$data_dir/setup_python.py" ${PY_REQUIRED_MAJOR})
+    # Only the app user can add archives: With "--offline" (or without network), the hash of a cached
+    # archive is taken from the JSON file next to it. Older package versions used a world writeable directory:
+    local parent_dir=$(dirname "$PY_ARCHIVE_CACHE_DIR")
+    mkdir -p "$parent_dir"
+    chown root:root "$parent_dir"
+    chmod 755 "$parent_dir"
+    find "$parent_dir" -maxdepth 1 -type f -delete
+    mkdir -p "$PY_ARCHIVE_CACHE_DIR"
+    chown "$app:$app" "$PY_ARCHIVE_CACHE_DIR"
+    chmod 700 "$PY_ARCHIVE_CACHE_DIR"
+
+    ynh_hide_warnings ynh_exec_as_app python3 "$data_dir/setup_python.py" -vv --cache-dir "$PY_ARCHIVE_CACHE_DIR" ${PY_REQUIRED_MAJOR}
+	py_app_version=$(ynh_exec_as_app python3 "$data_dir/setup_python.py" --cache-dir "$PY_ARCHIVE_CACHE_DIR" ${PY_REQUIRED_MAJOR})
 
 	# Print some version information:
 	ynh_print_info "Python version: $($py_app_version -VV)"
@@ -64,19 +99,76 @@ myynh_create_venv() {
     ynh_print_info "Setup Python virtualenv for $app ..."
     local venv_flag=$1
 
-    # Create a virtualenv with python installed by myynh_install_python():
-    ynh_exec_as_app $py_app_version -m venv $venv_flag --upgrade-deps "$data_dir/.venv"
+    # Create a virtualenv with python installed by myynh_install_python().
+    # pip, setuptools and wheel are updated from the wheelhouse by myynh_install_requirements():
+    ynh_exec_as_app $py_app_version -m venv $venv_flag "$venv_dir"
 
     # Print some version information:
-    ynh_print_info "venv Python version: $($data_dir/.venv/bin/python3 -VV)"
-    ynh_print_info "venv Pip version: $($data_dir/.venv/bin/python3 -m pip -V)"
-
-    ynh_print_info "Install $app dependencies in virtualenv..."
-    ynh_exec_as_app $data_dir/.venv/bin/pip3 install --upgrade pip wheel setuptools
+    ynh_print_info "venv Python version: $($venv_dir/bin/python3 -VV)"
+    ynh_print_info "venv Pip version: $($venv_dir/bin/python3 -m pip -V)"
 
     ynh_print_info "Install $app requirements into Python virtualenv..."
+    myynh_install_requirements
+}
+
+myynh_build_wheelhouse() {
+    #
+    # Build wheels of all requirements and lock the resolved requirements with the hashes of these wheels.
+    # The app owns the venv and lock_requirements.py, so both run as the app user in a temporary directory.
+    # Only regular files are copied by root into the wheelhouse of this app instance.
+    #
+    local wheelhouse=$1
+    local lock_file=$2
+    ynh_print_info "Build wheels of $app requirements in $wheelhouse ..."
+
+    local build_dir=$(mktemp -d)
+    chown "$app:$app" "$build_dir"
+    ynh_exec_as_app "$venv_dir/bin/python3" -m pip wheel \
+        --wheel-dir "$build_dir" pip setuptools wheel -r "$data_dir/requirements.txt"
+    ynh_exec_as_app "$venv_dir/bin/python3" "$data_dir/lock_requirements.py" \
+        --wheelhouse "$build_dir" --output "$build_dir/requirements.lock" -- pip setuptools wheel -r "$data_dir/requirements.txt"
 
-    ynh_exec_as_app $data_dir/.venv/bin/pip3 install -r "$data_dir/requirements.txt"
+    mkdir -p "$wheelhouse"
+    find "$build_dir" -maxdepth 1 -type f -name '*.whl' -exec cp --no-dereference -t "$wheelhouse" {} +
+    # Read by the app user: root must not follow a link to another file
+    ynh_exec_as_app cat "$build_dir/requirements.lock" | sed "s|$build_dir|$wheelhouse|g" > "$lock_file"
+    ynh_safe_rm "$build_dir"
+    if ! grep -q -- "--hash=" "$lock_file"; then
+        ynh_safe_rm "$lock_file"
+        ynh_die "Failed to lock the $app requirements"
+    fi
+    # Never keep links (a wheel replaced by the app during the copy):
+    find "$wheelhouse" -type l -delete
+    chmod -R a+rX "$PY_WHEELHOUSE_DIR"
+}
+
+myynh_install_requirements() {
+    #
+    # Install the requirements without network access from a local wheelhouse, keyed by the interpreter ABI.
+    # The wheelhouse and the lock file are only (re-)build, if the install from them failed,
+    # e.g.: changed requirements.txt, other Python version or a new host.
+    #
+    if [ ! -f "$data_dir/lock_requirements.py" ]; then
+        # e.g.: Restore of a backup from an older package version
+        ynh_exec_as_app $venv_dir/bin/pip3 install --upgrade pip wheel setuptools
+        ynh_exec_as_app $venv_dir/bin/pip3 install -r "$data_dir/requirements.txt"
+        return
+    fi
+
+    local python_abi=$(ynh_exec_as_app "$venv_dir/bin/python3" -c 'import sysconfig; print(sysconfig.get_config_var("SOABI"))')
+    local wheelhouse="$PY_WHEELHOUSE_DIR/$python_abi"
+    local requirements_hash=$(sha256sum "$data_dir/requirements.txt" | cut -c1-16)
+    local lock_file="$wheelhouse/requirements-${requirements_hash}.lock"
+
+    if [ -f "$lock_file" ] && ynh_exec_as_app $venv_dir/bin/pip3 install \
+        --no-index --find-links "$wheelhouse" --require-hashes -r "$lock_file"; then
+        ynh_print_info "$app requirements installed from $wheelhouse"
+        return
+    fi
+
+    myynh_build_wheelhouse "$wheelhouse" "$lock_file"
+    ynh_exec_as_app $venv_dir/bin/pip3 install \
+        --no-index --find-links "$wheelhouse" --require-hashes -r "$lock_file"
 }
 
 myynh_setup_python_venv() {
@@ -102,6 +194,151 @@ myynh_setup_python_venv() {
     fi
 }
 
+myynh_compile_bytecode() {
+    #
+    # Write the *.pyc files of the interpreter, the virtualenv and the app code ahead of time,
+    # so that the uvicorn workers don't compile them on the first start after install/upgrade.
+    # Must be called after myynh_fix_file_permissions(), as the app user.
+    #
+    ynh_print_info "Compile Python bytecode for $app..."
+    local stdlib_dir=$("$venv_dir/bin/python3" -c 'import sysconfig; print(sysconfig.get_path("stdlib"))')
+    # The standard library of an installed (not setup) Python is not writeable by the app user:
+    if ynh_exec_as_app test -w "$stdlib_dir"; then
+        ynh_exec_as_app "$venv_dir/bin/python3" -m compileall -q -j 0 "$stdlib_dir"
+    fi
+    ynh_exec_as_app "$venv_dir/bin/python3" -m compileall -q -j 0 \
+        "$venv_dir/lib" "$code_dir/umap_ynh" "$code_dir/settings.py" "$data_dir/setup_user.py"
+}
+
+myynh_new_release() {
+    #
+    # Use a new virtualenv, static files and code directory, while the running service still uses the current ones.
+    # The current static files are hard linked into the new directory, so running workers
+    # find the files of their version until they are restarted.
+    # The code directory contains "umap_ynh/" and "settings.py", "local_settings.py" stays in $data_dir.
+    #
+    release=$(date +%Y%m%d%H%M%S)
+    ynh_print_info "Prepare release $release of $app..."
+    venv_dir="$data_dir/.venvs/$release"
+    static_dir="$install_dir/static.d/$release"
+    code_dir="$data_dir/.releases/$release"
+
+    mkdir -p "$data_dir/.venvs" "$install_dir/static.d" "$code_dir"
+    # The virtualenv is created by the app user:
+    chown "$app:$app" "$data_dir/.venvs"
+    if [ -d "$install_dir/static" ]; then
+        cp -al "$install_dir/static/." "$static_dir"
+    else
+        mkdir -p "$static_dir"
+    fi
+}
+
+myynh_swap_symlink() {
+    # Replace the symlink atomically, see: https://rcrowley.org/2010/01/06/things-unix-can-do-atomically.html
+    local target=$1
+    local link=$2
+    if [ -d "$link" ] && [ ! -L "$link" ]; then
+        # A real directory from a version without releases, removed by myynh_remove_old_releases():
+        mv "$link" "$link.old"
+    fi
+    ln -sfn "$target" "$link.new"
+    mv -T "$link.new" "$link"
+}
+
+myynh_activate_release() {
+    ynh_print_info "Activate release $release of $app..."
+    myynh_swap_symlink ".venvs/$release" "$data_dir/.venv"
+    myynh_swap_symlink "static.d/$release" "$install_dir/static"
+    myynh_swap_symlink ".releases/$release/umap_ynh" "$data_dir/umap_ynh"
+    myynh_swap_symlink ".releases/$release/settings.py" "$data_dir/settings.py"
+    venv_dir="$data_dir/.venv"
+    static_dir="$install_dir/static"
+    code_dir="$data_dir"
+    # settings.py is written through the link by change_url, don't report it as manually modified:
+    ynh_store_file_checksum "$data_dir/settings.py"
+}
+
+myynh_remove_old_releases() {
+    local old_dir
+    for old_dir in "$data_dir/.venvs/"* "$install_dir/static.d/"* "$data_dir/.releases/"*; do
+        if [ "$(basename "$old_dir")" != "$release" ]; then
+            ynh_safe_rm "$old_dir"
+        fi
+    done
+    ynh_safe_rm "$data_dir/.venv.old"
+    ynh_safe_rm "$install_dir/static.old"
+    ynh_safe_rm "$data_dir/umap_ynh.old"
+}
+
+myynh_compute_workers() {
+    #
+    # Number of uvicorn worker processes: One per CPU core, but not more than fit
+    # into the "ram.runtime" budget and the database connections. At least two workers, so that one slow request
+    # (e.g.: a big GeoJSON upload) doesn't block all other requests and a
+    # "systemctl reload" can restart the workers one after another.
+    #
+    local cpu_count=$(nproc)
+    local ram_workers=$(( RAM_RUNTIME_MB / WORKER_RAM_MB ))
+    local workers=$(( cpu_count < ram_workers ? cpu_count : ram_workers ))
+    if [ "$workers" -lt 2 ]; then
+        workers=2
+    fi
+    echo "$(( workers < db_max_connections / 2 ? workers : db_max_connections / 2 ))"
+}
+
+myynh_clamp_workers() {
+    #
+    # The "workers" app setting may be changed by the admin: Not more workers than connection pools
+    # with two connections fit into $db_max_connections.
+    #
+    local max_workers=$(( db_max_connections / 2 ))
+    if [ "$workers" -gt "$max_workers" ]; then
+        ynh_print_warn "$workers workers need more than $db_max_connections database connections, use $max_workers workers"
+        workers=$max_workers
+        ynh_app_setting_set --key=workers --value="$workers"
+    fi
+}
+
+myynh_set_server_bind() {
+    #
+    # Set the placeholders of systemd.service and nginx_http.conf for the "server_bind" app setting:
+    # "socket": uvicorn listens on a Unix domain socket, "tcp": uvicorn listens on 127.0.0.1:$port
+    # All uvicorn workers accept the connections of the same socket.
+    #
+    if [ "$server_bind" = "socket" ]; then
+        # Only nginx sends the requests, the socket has no client address to check.
+        # nginx overwrites "X-Forwarded-For" with the client address, see nginx.conf:
+        uvicorn_bind="--uds /run/$app/uvicorn.sock --forwarded-allow-ips=*"
+        upstream_server="unix:/run/$app/uvicorn.sock"
+    else
+        uvicorn_bind="--port $port"
+        upstream_server="127.0.0.1:$port"
+    fi
+}
+
+myynh_wait_for_upstream() {
+    #
+    # Wait until uvicorn accepts connections on $upstream_server, before nginx is reloaded onto it.
+    #
+    local i
+    for i in $(seq 30); do
+        if [ "$server_bind" = "socket" ]; then
+            [ -S "/run/$app/uvicorn.sock" ] && return
+        elif (exec 3<>"/dev/tcp/127.0.0.1/$port") 2>/dev/null; then
+            return
+        fi
+        sleep 1
+    done
+    ynh_print_warn "uvicorn is not listening on $upstream_server after 30 seconds"
+}
+
+myynh_setup_nginx_cache() {
+    # Caches of the ajax proxy and the Overpass proxy, see "proxy_cache_path" in nginx_http.conf
+    # nginx creates only the last path component and Debian doesn't create /var/cache/nginx:
+    mkdir -p "/var/cache/nginx/$app" "/var/cache/nginx/$app-overpass"
+    chown -R www-data:www-data "/var/cache/nginx/$app" "/var/cache/nginx/$app-overpass"
+}
+
 myynh_setup_log_file() {
     mkdir -p "$(dirname "$log_file")"
     touch "$log_file"
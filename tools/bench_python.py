@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the two ways to get a newer Python interpreter (see "update_python" in manifest.toml):
+
+* SETUP: `conf/setup_python.py` downloads a redistributable Python
+* INSTALL: `conf/install_python.py` builds Python from source
+
+The "bootstrap" command runs one of the scripts against local fixtures and prints the time of each phase.
+Everything is installed into a temporary directory: The scripts don't see the system Python
+(they would just return it) and INSTALL uses a temporary prefix instead of /usr/local.
+The "workload" command runs a small uMap like workload (GeoJSON and Django templates) on given interpreters.
+
+e.g.:
+
+    # Fixtures for SETUP: a "cpython-3.11.*.tar.zst" (or .tar.gz) archive from python-build-standalone
+    # Fixtures for INSTALL: a "Python-3.11.*.tar.xz" source archive
+    ./tools/bench_python.py bootstrap setup --fixtures ~/fixtures/ --requirements conf/requirements.txt
+    ./tools/bench_python.py bootstrap install --fixtures ~/fixtures/
+
+    ./tools/bench_python.py workload ~/.local/bin/python3.11 /usr/local/bin/python3.11
+
+The results are printed as JSON to stdout.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import functools
+import hashlib
+import http.server
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+CONF_PATH = Path(__file__).resolve().parent.parent / 'conf'
+
+logger = logging.getLogger(__name__)
+
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    """
+    Serve the fixture files and fake the GitHub release API and the Python FTP index.
+    """
+
+    def __init__(self, fixtures_path: Path):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.fixtures_path = fixtures_path
+        self.routes = {}
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def add_json(self, path: str, data: dict):
+        self.routes[path] = json.dumps(data).encode()
+
+    def add_file(self, path: str, file_path: Path):
+        self.routes[path] = file_path
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug('Fixture server: ' + format, *args)
+
+    def do_GET(self):
+        content = self.server.routes.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        if isinstance(content, Path):
+            content = content.read_bytes()
+
+        # Support HTTP "Range" requests, like GitHub does:
+        if match := re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', '')):
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(content) - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(content)}')
+            content = content[start : end + 1]
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class PhaseTimer:
+    """
+    Sum up the time spend in the wrapped functions per phase.
+    Time of nested phases will not be counted in the outer phase.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.stack = []
+
+    def wrap(self, module, func_name: str, phase: str):
+        func = getattr(module, func_name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.measure(phase):
+                return func(*args, **kwargs)
+
+        setattr(module, func_name, wrapper)
+
+    @contextlib.contextmanager
+    def measure(self, phase: str):
+        if self.stack:
+            self.add(self.stack[-1][0], time.perf_counter() - self.stack[-1][1])
+        self.stack.append([phase, time.perf_counter()])
+        try:
+            yield
+        finally:
+            phase, start = self.stack.pop()
+            self.add(phase, time.perf_counter() - start)
+            if self.stack:
+                # Continue the time measurement of the outer phase:
+                self.stack[-1][1] = time.perf_counter()
+
+    def add(self, phase: str, duration: float):
+        self.timings[phase] = self.timings.get(phase, 0) + duration
+
+
+def import_conf_script(name: str):
+    sys.path.insert(0, str(CONF_PATH))
+    try:
+        return __import__(name)
+    finally:
+        sys.path.remove(str(CONF_PATH))
+
+
+class ShutilWithoutPython:
+    """
+    "shutil" for the benchmarked scripts, that finds no Python interpreter in PATH:
+    The scripts would return the system Python, if it's the requested major version.
+    """
+
+    def __getattr__(self, name):
+        return getattr(shutil, name)
+
+    @staticmethod
+    def which(cmd, *args, **kwargs):
+        if re.fullmatch(r'python[\d.]*', str(cmd)):
+            logger.debug('Hide %s from the benchmarked script', cmd)
+            return None
+        return shutil.which(cmd, *args, **kwargs)
+
+
+def bench_setup(*, fixtures_path: Path, major_version: str, timer: PhaseTimer, temp_path: Path) -> Path:
+    setup_python = import_conf_script('setup_python')
+    setup_python.shutil = ShutilWithoutPython()
+
+    archives = sorted(fixtures_path.glob(f'cpython-{major_version}.*.tar.*'))
+    archives = [path for path in archives if not path.name.endswith(f'.{setup_python.HASH_NAME}')]
+    if not archives:
+        raise FileNotFoundError(f'No "cpython-{major_version}.*.tar.*" archive in {fixtures_path}')
+
+    with FixtureServer(fixtures_path) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        tag = None
+        assets = []
+        for archive_path in archives:
+            if match := re.search(r'\+(\d+)-', archive_path.name):
+                tag = match.group(1)
+            hash_value = hashlib.sha256(archive_path.read_bytes()).hexdigest()
+            hash_name = f'{archive_path.name}.{setup_python.HASH_NAME}'
+            server.add_file(f'/download/{archive_path.name}', archive_path)
+            server.routes[f'/download/{hash_name}'] = hash_value.encode()
+            assets.append(
+                dict(
+                    name=archive_path.name,
+                    size=archive_path.stat().st_size,
+                    browser_download_url=f'{server.base_url}/download/{archive_path.name}',
+                )
+            )
+            assets.append(
+                dict(name=hash_name, size=64, browser_download_url=f'{server.base_url}/download/{hash_name}')
+            )
+        assert tag, f'No release tag found in {archives}'
+
+        server.add_json('/latest-release.json', dict(tag=tag))
+        server.add_json(f'/repos/{setup_python.GUTHUB_PROJECT}/releases/tags/{tag}', dict(assets=assets))
+        setup_python.LASTEST_RELEASE_URL = f'{server.base_url}/latest-release.json'
+        setup_python.GITHUB_API_URL = server.base_url
+
+        timer.wrap(setup_python, 'get_latest_tag', 'metadata')
+        timer.wrap(setup_python, 'get_release_archive', 'metadata')
+        timer.wrap(setup_python, 'download', 'download')
+        timer.wrap(setup_python, 'hash_file', 'verify')
+        timer.wrap(setup_python, 'extract_archive', 'extract')
+
+        # Don't touch the real home directory:
+        home_path = temp_path / 'home'
+        home_path.mkdir()
+        os.environ['HOME'] = str(home_path)
+        os.environ['XDG_CACHE_HOME'] = str(temp_path / 'xdg_cache')
+        with timer.measure('setup_python'):
+            return setup_python.setup_python(
+                major_version=major_version,
+                force_update=True,
+                cache_path=temp_path / 'archive_cache',
+                metadata_ttl=0,
+            )
+
+
+def bench_install(*, fixtures_path: Path, major_version: str, timer: PhaseTimer, temp_path: Path) -> Path:
+    install_python = import_conf_script('install_python')
+    install_python.shutil = ShutilWithoutPython()
+
+    # Install into a temporary prefix, not into /usr/local:
+    prefix_path = temp_path / 'prefix'
+    (prefix_path / 'bin').mkdir(parents=True)
+    install_python.DEFAULT_INSTALL_PREFIX = str(prefix_path)
+    run_build_step = install_python.run_build_step
+
+    def run_build_step_with_prefix(args, **kwargs):
+        if args[0] == './configure':
+            args = [*args, f'--prefix={prefix_path}']
+        return run_build_step(args, **kwargs)
+
+    install_python.run_build_step = run_build_step_with_prefix
+
+    archives = sorted(fixtures_path.glob(f'Python-{major_version}.*.tar.xz'))
+    if not archives:
+        raise FileNotFoundError(f'No "Python-{major_version}.*.tar.xz" archive in {fixtures_path}')
+    archive_path = archives[-1]
+    version = archive_path.name[len('Python-') : -len('.tar.xz')]
+
+    with FixtureServer(fixtures_path) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        asc_path = archive_path.with_name(f'{archive_path.name}.asc')
+        if not asc_path.is_file():
+            raise FileNotFoundError(f'Signature {asc_path} missing (Download it next to the archive)')
+
+        server.routes['/ftp/'] = f'<a href="{version}/">{version}/</a>'.encode()
+        server.add_file(f'/ftp/{version}/{archive_path.name}', archive_path)
+        server.add_file(f'/ftp/{version}/{asc_path.name}', asc_path)
+        install_python.PY_FTP_INDEX_URL = f'{server.base_url}/ftp/'
+
+        timer.wrap(install_python, 'get_html_page', 'metadata')
+        timer.wrap(install_python, 'download2temp', 'download')
+        timer.wrap(install_python, 'verify_download', 'verify')
+        timer.wrap(install_python, 'build_python', 'build')
+
+        with timer.measure('install_python'):
+            return install_python.install_python(
+                major_version,
+                cache_path=temp_path / 'build_cache',
+            )
+
+
+def bench_venv(*, python_bin: Path, timer: PhaseTimer, temp_path: Path, requirements: Path | None):
+    """
+    Create a virtualenv like "myynh_create_venv" in scripts/_common.sh
+    """
+    venv_path = temp_path / 'venv'
+    with timer.measure('venv'):
+        subprocess.run([python_bin, '-m', 'venv', '--upgrade-deps', venv_path], check=True)
+    if requirements:
+        with timer.measure('requirements'):
+            subprocess.run([venv_path / 'bin' / 'pip', 'install', '-r', requirements], check=True)
+    return venv_path / 'bin' / 'python3'
+
+
+"""
+A small workload, similar to what uMap does: Serialize and parse GeoJSON and render Django templates.
+Runs in the interpreter to benchmark, so it must be compatible with Python 3.9 and without dependencies.
+Django is optional, the template benchmark is skipped, if Django is not installed.
+"""
+WORKLOAD = r'''
+import json
+import random
+import sys
+import time
+
+feature_count, repeat = int(sys.argv[1]), int(sys.argv[2])
+
+
+def bench(func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+random.seed(1)
+features = []
+for i in range(feature_count):
+    if i % 10:
+        geometry = {'type': 'Point', 'coordinates': [random.uniform(-180, 180), random.uniform(-90, 90)]}
+    else:
+        geometry = {
+            'type': 'Polygon',
+            'coordinates': [[[random.uniform(-180, 180), random.uniform(-90, 90)] for _ in range(50)]],
+        }
+    features.append(
+        {
+            'type': 'Feature',
+            'geometry': geometry,
+            'properties': {'name': f'Feature {i}', 'description': 'Lorem ipsum ' * 5, '_umap_options': {}},
+        }
+    )
+collection = {'type': 'FeatureCollection', 'features': features, '_umap_options': {'name': 'Layer'}}
+geojson = json.dumps(collection)
+
+results = {
+    'python': sys.version,
+    'geojson_bytes': len(geojson),
+    'json_dumps': bench(lambda: json.dumps(collection)),
+    'json_loads': bench(lambda: json.loads(geojson)),
+}
+
+try:
+    import django
+    from django.conf import settings
+except ImportError:
+    results['django_template'] = None
+else:
+    settings.configure(TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates'}])
+    django.setup()
+    from django.template import engines
+
+    template = engines['django'].from_string(
+        '<ul>{% for feature in features %}'
+        '<li title="{{ feature.properties.description }}">{{ feature.properties.name|upper }}'
+        '{% if feature.geometry.type == "Point" %} ({{ feature.geometry.coordinates.0|floatformat:4 }}){% endif %}'
+        '</li>{% endfor %}</ul>'
+    )
+    results['django'] = django.get_version()
+    results['django_template'] = bench(lambda: template.render({'features': features[:2000]}))
+
+print(json.dumps(results))
+'''
+
+
+def bench_workload(python_bin: Path, *, feature_count: int, repeat: int) -> dict:
+    startup = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([python_bin, '-c', 'pass'], check=True)
+        startup.append(time.perf_counter() - start)
+
+    output = subprocess.run(
+        [python_bin, '-c', WORKLOAD, str(feature_count), str(repeat)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return {'interpreter': str(python_bin), 'startup': min(startup), **json.loads(output)}
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Benchmark setup_python.py vs. install_python.py and the resulting interpreters',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='count',
+        default=0,
+        help='Increase verbosity level (can be used multiple times, e.g.: -vv)',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bootstrap = subparsers.add_parser('bootstrap', help='Time each phase of the Python setup/install')
+    bootstrap.add_argument('mode', choices=['setup', 'install'])
+    bootstrap.add_argument('--fixtures', type=Path, required=True, help='Directory with the archives')
+    bootstrap.add_argument('--major-version', default='3.11')
+    bootstrap.add_argument('--requirements', type=Path, help='Also time "pip install -r" into the venv')
+    bootstrap.add_argument('--skip-workload', action='store_true', help='Do not run the workload afterwards')
+    bootstrap.add_argument('--feature-count', type=int, default=20_000)
+    bootstrap.add_argument('--repeat', type=int, default=5)
+
+    workload = subparsers.add_parser('workload', help='Run the uMap like workload on the given interpreters')
+    workload.add_argument('interpreters', nargs='+', type=Path)
+    workload.add_argument('--feature-count', type=int, default=20_000)
+    workload.add_argument('--repeat', type=int, default=5)
+    return parser
+
+
+def main(args=None):
+    parser = get_parser()
+    args = parser.parse_args(args=args)
+    verbose2level = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
+    logging.basicConfig(
+        level=verbose2level.get(args.verbose, logging.DEBUG),
+        format='%(levelname)9s %(message)s',
+        stream=sys.stderr,
+    )
+
+    if args.command == 'workload':
+        results = [
+            bench_workload(python_bin, feature_count=args.feature_count, repeat=args.repeat)
+            for python_bin in args.interpreters
+        ]
+    else:
+        timer = PhaseTimer()
+        with tempfile.TemporaryDirectory(prefix='bench_python_') as temp_dir:
+            temp_path = Path(temp_dir)
+            bench_func = bench_setup if args.mode == 'setup' else bench_install
+            python_bin = bench_func(
+                fixtures_path=args.fixtures,
+                major_version=args.major_version,
+                timer=timer,
+                temp_path=temp_path,
+            )
+            venv_python = bench_venv(
+                python_bin=python_bin,
+                timer=timer,
+                temp_path=temp_path,
+                requirements=args.requirements,
+            )
+            results = {
+                'mode': args.mode,
+                'python': str(python_bin),
+                'phases': {phase: round(duration, 3) for phase, duration in timer.timings.items()},
+            }
+            if not args.skip_workload:
+                results['workload'] = bench_workload(venv_python, feature_count=args.feature_count, repeat=args.repeat)
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
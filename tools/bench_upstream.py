@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the upstream connection between nginx and uvicorn (see "server_bind" in doc/ADMIN.md):
+
+* tcp: uvicorn listens on 127.0.0.1:<port>
+* socket: uvicorn listens on a Unix domain socket
+
+Both are measured with a new connection per request (nginx without "keepalive")
+and with one reused connection (nginx "keepalive" upstream). The app is a minimal ASGI app,
+so the times are the overhead of the connection and the HTTP handling, not of uMap.
+
+e.g.:
+
+    ./tools/bench_upstream.py /home/yunohost.app/umap/.venv/bin/python --requests 5000
+
+The results are printed as JSON to stdout.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+APP = '''
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    body = b'{"ok":true}'
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+'''
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: Path, **kwargs):
+        super().__init__('localhost', **kwargs)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(str(self.socket_path))
+        self.sock = sock
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(python_bin: Path, *, temp_path: Path, bind: list[str]) -> subprocess.Popen:
+    (temp_path / 'bench_app.py').write_text(APP)
+    return subprocess.Popen(
+        [python_bin, '-m', 'uvicorn', '--app-dir', temp_path, '--no-access-log', '--log-level', 'warning', *bind]
+        + ['bench_app:app'],
+    )
+
+
+def wait_ready(new_connection, *, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = new_connection()
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def measure(new_connection, *, requests: int, keepalive: bool) -> dict:
+    timings = []
+    conn = new_connection() if keepalive else None
+    for _ in range(requests):
+        start = time.perf_counter()
+        if not keepalive:
+            conn = new_connection()
+        conn.request('GET', '/', headers={'Host': 'localhost'})
+        response = conn.getresponse()
+        response.read()
+        if not keepalive:
+            conn.close()
+        timings.append(time.perf_counter() - start)
+    if keepalive:
+        conn.close()
+
+    quantiles = statistics.quantiles(timings, n=100)
+    return {
+        'requests': requests,
+        'p50_us': round(statistics.median(timings) * 1e6, 1),
+        'p99_us': round(quantiles[98] * 1e6, 1),
+        'mean_us': round(statistics.fmean(timings) * 1e6, 1),
+    }
+
+
+def bench_bind(python_bin: Path, *, mode: str, temp_path: Path, requests: int) -> dict:
+    if mode == 'socket':
+        socket_path = temp_path / 'uvicorn.sock'
+        bind = ['--uds', str(socket_path)]
+
+        def new_connection():
+            return UnixHTTPConnection(socket_path, timeout=5)
+
+    else:
+        port = get_free_port()
+        bind = ['--host', '127.0.0.1', '--port', str(port)]
+
+        def new_connection():
+            return http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+
+    process = start_uvicorn(python_bin, temp_path=temp_path, bind=bind)
+    try:
+        wait_ready(new_connection)
+        # Warm up:
+        measure(new_connection, requests=min(requests, 200), keepalive=True)
+        results = {}
+        for keepalive in (False, True):
+            name = 'keepalive' if keepalive else 'new_connection'
+            results[name] = measure(new_connection, requests=requests, keepalive=keepalive)
+            logger.info('%s %s: %s', mode, name, results[name])
+        return results
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Benchmark TCP vs. Unix domain socket and new vs. kept-alive connections to uvicorn',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='count',
+        default=0,
+        help='Increase verbosity level (can be used multiple times, e.g.: -vv)',
+    )
+    parser.add_argument('python', type=Path, help='Python interpreter with "uvicorn" installed, e.g. of the app venv')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per measurement')
+    return parser
+
+
+def main(args=None):
+    parser = get_parser()
+    args = parser.parse_args(args=args)
+    verbose2level = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
+    logging.basicConfig(
+        level=verbose2level.get(args.verbose, logging.DEBUG),
+        format='%(levelname)9s %(message)s',
+        stream=sys.stderr,
+    )
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_upstream_') as temp_dir:
+        for mode in ('tcp', 'socket'):
+            results[mode] = bench_bind(args.python, mode=mode, temp_path=Path(temp_dir), requests=args.requests)
+
+    # Saved time per request compared with the former setup (TCP, new connection per request):
+    baseline = results['tcp']['new_connection']['p50_us']
+    results['saved_p50_us'] = {
+        f'{mode}_{name}': round(baseline - results[mode][name]['p50_us'], 1)
+        for mode in ('tcp', 'socket')
+        for name in ('new_connection', 'keepalive')
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()